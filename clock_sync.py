@@ -0,0 +1,144 @@
+"""Host-side link timing: RTT, one-way latency and device/host clock mapping."""
+import threading
+import time
+from collections import deque
+
+# MicroPython ticks_ms() wraps at 2**30
+TICKS_PERIOD = 1 << 30
+
+PING_INTERVAL = 1.0  # s between automatic PINGs
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an iterable, or None if it is empty"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+class ClockSync:
+    """NTP-style offset and drift estimate between device ticks_ms and the host clock
+
+    Host times are time.monotonic() seconds. The offset is device minus host,
+    fitted as a line over the lowest-RTT pings in the window so queueing
+    delay on the link doesn't skew it. The reader thread feeds it while a
+    GUI reads it, so every public method holds the lock.
+    """
+
+    def __init__(self, window=32, history=256):
+        self.window = window
+        self.history = history
+        # Reentrant: add_ping and observe unwrap ticks through device_seconds
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        self.samples = deque(maxlen=self.window)     # (host_mid, offset, rtt)
+        self.rtts = deque(maxlen=self.history)
+        self.latencies = deque(maxlen=self.history)
+        self.offset = None
+        self.drift = 0.0
+        self.reference = 0.0
+        self.last_ticks = None
+        self.last_unwrapped = 0
+
+    def reset(self):
+        """Forget everything, e.g. after the board resets and ticks restart"""
+        with self.lock:
+            self.clear()
+
+    def device_seconds(self, ticks):
+        """Unwrap a ticks_ms value into monotonic device seconds"""
+        with self.lock:
+            return self.unwrap(ticks)
+
+    def unwrap(self, ticks):
+        if self.last_ticks is None:
+            self.last_ticks = ticks
+            self.last_unwrapped = ticks
+        delta = (ticks - self.last_ticks) % TICKS_PERIOD
+        if delta >= TICKS_PERIOD // 2:
+            # Slightly older than the newest value seen, not a full wrap ahead
+            delta -= TICKS_PERIOD
+        unwrapped = self.last_unwrapped + delta
+        if delta > 0:
+            self.last_ticks = ticks
+            self.last_unwrapped = unwrapped
+        return unwrapped / 1000
+
+    def add_ping(self, host_sent, device_received, device_sent, host_received):
+        """Fold in one PING/PONG exchange; returns its RTT in seconds"""
+        with self.lock:
+            d_rx = self.unwrap(device_received)
+            d_tx = self.unwrap(device_sent)
+            rtt = (host_received - host_sent) - (d_tx - d_rx)
+            offset = ((d_rx - host_sent) + (d_tx - host_received)) / 2
+            self.samples.append(((host_sent + host_received) / 2, offset, rtt))
+            self.rtts.append(rtt)
+            self.fit()
+            return rtt
+
+    def fit(self):
+        # Keep the better half of the window by RTT; those saw the least queueing
+        cutoff = percentile([s[2] for s in self.samples], 0.5)
+        best = [s for s in self.samples if s[2] <= cutoff]
+        self.reference = sum(s[0] for s in best) / len(best)
+        mean_offset = sum(s[1] for s in best) / len(best)
+        spread = sum((s[0] - self.reference) ** 2 for s in best)
+        if len(best) >= 3 and spread > 0:
+            self.drift = sum((s[0] - self.reference) * (s[1] - mean_offset) for s in best) / spread
+        self.offset = mean_offset
+
+    def synced(self):
+        return self.offset is not None
+
+    def to_host(self, ticks):
+        """Map a device ticks_ms value onto the host monotonic timeline"""
+        with self.lock:
+            device = self.unwrap(ticks)
+            # device = host + offset + drift * (host - reference), solved for host
+            return (device - self.offset + self.drift * self.reference) / (1 + self.drift)
+
+    def observe(self, ticks, host_received):
+        """Record the one-way latency of a timestamped STATUS/ACK; returns it or None"""
+        with self.lock:
+            if not self.synced():
+                return None
+            latency = host_received - self.to_host(ticks)
+            self.latencies.append(latency)
+            return latency
+
+    def stats(self):
+        """RTT and latency percentiles in ms, offset in ms and drift in ppm"""
+        def ms(value):
+            return None if value is None else value * 1000
+
+        with self.lock:
+            # Copied under the lock; the percentiles sort outside it
+            rtts = list(self.rtts)
+            latencies = list(self.latencies)
+            offset = self.offset
+            drift = self.drift
+        return {
+            "rtt_p50": ms(percentile(rtts, 0.5)),
+            "rtt_p95": ms(percentile(rtts, 0.95)),
+            "latency_p50": ms(percentile(latencies, 0.5)),
+            "latency_p95": ms(percentile(latencies, 0.95)),
+            "offset": ms(offset),
+            "drift_ppm": drift * 1e6,
+        }
+
+
+def ping_command(seq, host_time=None):
+    """Build a PING line; the host time is echoed back in microseconds"""
+    if host_time is None:
+        host_time = time.monotonic()
+    return f"PING:{seq}:{int(host_time * 1e6)}"
+
+
+def parse_pong(line):
+    """Split PONG:<seq>:<host_us>:<device_rx>:<device_tx> into (seq, host_sent, rx, tx)"""
+    _, seq, host_us, device_rx, device_tx = line.strip().split(":")
+    return int(seq), int(host_us) / 1e6, int(device_rx), int(device_tx)
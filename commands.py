@@ -0,0 +1,81 @@
+import json
+from logger import LEVEL_NAMES
+
+# Argument parsers: turn the text after "NAME:" into the handler's argument,
+# raising ValueError when it is malformed
+
+def text(argument):
+    return argument
+
+def level(argument):
+    value = LEVEL_NAMES.get(argument)
+    if value is None:
+        raise ValueError("unknown log level")
+    return value
+
+def json_value(argument):
+    return json.loads(argument)
+
+# Parsers a command can declare; None means the command takes no argument
+PARSERS = {"int": int, "float": float, "text": text, "level": level, "json": json_value}
+
+
+class Command:
+    """One registered command: its handler, how its argument is parsed, and its timing"""
+
+    def __init__(self, name, handler=None, parse=None, motion=False, local=False):
+        self.name = name
+        self.handler = handler
+        self.parse = PARSERS[parse] if isinstance(parse, str) else parse
+        self.motion = motion  # refused while the E-STOP is latched
+        self.local = local    # answered on the reading core even in dual-core mode
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    def record(self, elapsed_us):
+        if self.count == 0 or elapsed_us < self.min_us:
+            self.min_us = elapsed_us
+        if elapsed_us > self.max_us:
+            self.max_us = elapsed_us
+        self.count += 1
+        self.total_us += elapsed_us
+
+    def report(self):
+        return {
+            "count": self.count,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "mean_us": self.total_us // self.count if self.count else 0
+        }
+
+
+class CommandRegistry:
+    """Commands keyed by the name before the first ':' for one dict lookup per line"""
+
+    def __init__(self):
+        self.commands = {}
+        self.unknown = 0
+
+    def register(self, name, handler, parse=None, motion=False, local=False):
+        self.commands[name] = Command(name, handler, parse, motion, local)
+
+    def split(self, cmd):
+        """(name, argument text or None) of a command line"""
+        colon = cmd.find(":")
+        if colon < 0:
+            return cmd, None
+        return cmd[:colon], cmd[colon + 1:]
+
+    def lookup(self, cmd):
+        """(Command or None, argument text or None) for a command line"""
+        name, argument = self.split(cmd)
+        return self.commands.get(name), argument
+
+    def stats(self):
+        """Per-command count and handling time for CMD_STATS; unused commands are left out"""
+        return {
+            "commands": {name: command.report() for name, command in self.commands.items() if command.count},
+            "unknown": self.unknown
+        }
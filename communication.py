@@ -1,82 +1,459 @@
 import json
+import time
+from estop import ESTOP_BYTE, RESUME_BYTE
+from utilities import log
+from config_manager import valid_config
+from commands import CommandRegistry
+from dual_core import RingBuffer
+
+# Longest command line; longer lines are dropped whole. CONFIG_PUSH carries
+# a whole axis table, so this is sized for that rather than for commands.
+LINE_MAX = 1024
+NEWLINE = 0x0A
+
+# Requests the main loop acts on, drained from Communication.events
+EVENT_MODE = "mode"         # value: mode index
+EVENT_RESTART = "restart"   # value: None
+EVENT_SLOTS = 8
+
+# Command lines that finish arriving while only control bytes are acted on
+HELD_SLOTS = 8
 
 class Communication:
     def __init__(self, hardware, debug_log):
         self.hardware = hardware
         self.debug_log = debug_log
-        self.command_buffer = ""
+        # Preallocated so reading a byte never allocates
+        self.line = bytearray(LINE_MAX)
+        self.line_view = memoryview(self.line)
+        self.line_length = 0
+        self.line_overflow = False
+        self.char = bytearray(1)
+        # Device time (ticks_ms) the last complete command line arrived
+        self.line_time = 0
+        # Set by main.py; reported once on the first STATUS
+        self.boot_profile = None
+        # Ring to core 0 in dual-core mode; None runs commands where they are read
+        self.command_queue = None
+        # Set by main.py; heap and GC pause figures for STATUS
+        self.gc_monitor = None
+        # Set by main.py; the on-device sequence library
+        self.library = None
+        # Set by main.py; applies RELOAD_CONFIG and CONFIG_PUSH
+        self.config_manager = None
+        # Opcode -> handler table, with per-command timing for CMD_STATS
+        self.commands = CommandRegistry()
+        self.register_commands()
+        # Mode changes and restarts for the main loop, in the order they arrived
+        self.events = RingBuffer(EVENT_SLOTS)
+        # Lines read by wait_control, run by the next full process_incoming
+        self.held = RingBuffer(HELD_SLOTS)
+        # Reused by every STATUS; rebuilt when the axis table changes
+        self.status = None
+        self.status_axes = []
+        self.one_core = [None]
+        self.two_cores = [None, None]
         
-    def process_incoming(self):
-        while self.hardware.uart.any():
+    def process_incoming(self, control_only=False):
+        """Read what has arrived; with control_only, finished lines are held rather than run"""
+        uart = self.hardware.uart
+        char = self.char
+        line = self.line
+        if not control_only:
+            while True:
+                cmd = self.held.get()
+                if cmd is None:
+                    break
+                self.dispatch(cmd)
+        while uart.any():
             #self.debug_log(f"Looking for incomming commands...")
-            char = self.hardware.uart.read(1)
-            if char == b'\n' or char == '\n':  # Handle both bytes and str
+            if not uart.readinto(char):
+                break
+            byte = char[0]
+            if byte == ESTOP_BYTE or byte == RESUME_BYTE:
+                # Ahead of line parsing, and without disturbing a half-read line
+                self.handle_control(byte, time.ticks_us())
+                continue
+            if byte == NEWLINE:
                 #self.debug_log(f"Found an end char")
-                self.process_command(self.command_buffer)
-                self.command_buffer = ""
-            elif char:
+                self.line_time = time.ticks_ms()
+                length = self.line_length
+                self.line_length = 0
+                if self.line_overflow:
+                    self.line_overflow = False
+                    log.warn("Command longer than %d bytes dropped", LINE_MAX)
+                    continue
                 try:
-                    #self.debug_log(f"reveived a char: {char}")
-                    # Handle both bytes and string
-                    if isinstance(char, bytes):
-                        char = char.decode('utf-8')
-                    self.command_buffer += char
+                    # The only allocation is the finished command itself
+                    cmd = str(self.line_view[:length], 'utf-8').strip()
                 except UnicodeError:
                     self.debug_log("Invalid character in command stream")
-                    self.command_buffer = ""
+                    continue
+                if not cmd:
+                    continue
+                if not control_only:
+                    self.dispatch(cmd)
+                elif not self.held.put(cmd):
+                    log.warn("Too many commands held, dropped: %s", cmd)
+                    self.send_ack(cmd, False)
+            elif self.line_length < LINE_MAX:
+                line[self.line_length] = byte
+                self.line_length += 1
+            else:
+                self.line_overflow = True
             #self.debug_log(f"end of process_incoming")
-    def process_command(self, cmd):
-        self.debug_log(f"Received command: {cmd}")
-        
-        if cmd == "HOME_ALL":
-            self.hardware.home_all_axes()
-        elif cmd.startswith("HOME_AXIS:"):
-            try:
-                index = int(cmd.split(":")[1])
-                if 0 <= index < len(self.hardware.axes):
-                    self.hardware.home_single_axis(index)
-                else:
-                    self.debug_log(f"Invalid axis index: {index}")
-            except ValueError:
-                self.debug_log("Invalid HOME_AXIS command format")
-        elif cmd == "RESTART_PLAYBACK":
-            # Will be handled by mode
-            pass
-        # Add mode change command handling
-        elif cmd.startswith("SET_MODE:"):
-            try:
-                mode_index = int(cmd.split(":")[1])
-                # This should trigger a mode change in main.py
-                self.debug_log(f"Mode change requested: {mode_index}")
-                # We'll handle this in main.py by setting a flag
-                self.requested_mode = mode_index
-            except ValueError:
-                self.debug_log("Invalid SET_MODE command format")
+            
+    def wait(self, ms, control_only=False):
+        """Sleep up to ms, but read input (and so any E-STOP byte) the moment it arrives
+
+        Returns the us spent blocked on the port; time spent handling what
+        arrived is work, not idle.
+        """
+        deadline = time.ticks_add(time.ticks_ms(), ms)
+        remaining = ms
+        idle = 0
+        while remaining > 0:
+            started = time.ticks_us()
+            ready = self.hardware.uart.wait(remaining)
+            idle += time.ticks_diff(time.ticks_us(), started)
+            if ready:
+                self.process_incoming(control_only)
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+        return idle
+    
+    def wait_control(self, ms):
+        """wait() that acts only on E-STOP/RESUME; commands run at the next full poll
+
+        For spins inside the main loop (overload recovery), where running a
+        whole command would re-enter motion code that is mid-update.
+        """
+        return self.wait(ms, True)
+    
+    def handle_control(self, byte, received_us):
+        estop = self.hardware.estop
+        if estop is None:
+            return
+        if byte == ESTOP_BYTE:
+            latency = estop.trigger(received_us)
+            self.send_estop("stopped", latency)
+            log.warn("E-STOP: servos off %dus after the byte was read", latency)
         else:
-            self.debug_log(f"Unknown command: {cmd}")
+            estop.release()
+            self.send_estop("resumed", None)
+            log.info("E-STOP released")
+    
+    def send_estop(self, state, latency):
+        """Confirm an E-STOP or RESUME with the device time and read-to-disabled latency"""
+        estop = json.dumps({"state": state, "t": time.ticks_ms(), "latency_us": latency,
+                            "count": self.hardware.estop.count})
+        self.hardware.uart.write("ESTOP:" + estop + "\n")
+    
+    def dispatch(self, cmd):
+        if self.command_queue is not None:
+            # Hardware commands run on the motion core; local ones (PING) are answered right here
+            command, _ = self.commands.lookup(cmd)
+            if command is None or not command.local:
+                if not self.command_queue.put(cmd):
+                    log.warn("Command queue full, dropped: %s", cmd)
+                    self.send_ack(cmd, False)
+                return
+        ok = self.process_command(cmd)
+        if ok is not None:
+            self.send_ack(cmd, ok)
+    
+    def run_queued(self):
+        """Run the commands core 1 queued for this core (dual-core mode)"""
+        while True:
+            cmd = self.command_queue.get()
+            if cmd is None:
+                return
+            ok = self.process_command(cmd)
+            if ok is not None:
+                self.send_ack(cmd, ok)
+    
+    def process_command(self, cmd):
+        """Run one command; returns whether it succeeded, or None if it sends its own reply"""
+        self.debug_log("Received command: %s", cmd)
+        command, argument = self.commands.lookup(cmd)
+        if command is None:
+            self.commands.unknown += 1
+            log.warn("Unknown command: %s", cmd)
+            return False
+        started = time.ticks_us()
+        ok = self.run_command(command, argument, cmd)
+        command.record(time.ticks_diff(time.ticks_us(), started))
+        return ok
+    
+    def run_command(self, command, argument, cmd):
+        estop = self.hardware.estop
+        if command.motion and estop and estop.latched:
+            log.warn("E-STOP latched, refused: %s", cmd)
+            return False
+        if command.parse is None:
+            if argument is not None:
+                log.warn("%s takes no argument", command.name)
+                return False
+            return command.handler()
+        try:
+            if argument is None:
+                raise ValueError("missing argument")
+            value = command.parse(argument)
+        except ValueError:
+            log.warn("Invalid %s command format", command.name)
+            return False
+        return command.handler(value)
+    
+    def register_commands(self):
+        """The command table; argument parsing is declared here once per command"""
+        register = self.commands.register
+        register("PING", self.send_pong, "text", local=True)
+        register("HOME_ALL", self.home_all, motion=True)
+        register("HOME_AXIS", self.home_axis, "int", motion=True)
+        register("RESTART_PLAYBACK", self.restart_playback, motion=True)
+        register("SET_MODE", self.set_mode, "int", motion=True)
+        register("SELECT_SEQUENCE", self.select_sequence, "text", motion=True)
+        register("SPEED", self.set_speed, "float")
+        register("LIST_SEQUENCES", self.list_sequences)
+        register("SCAN_SEQUENCES", self.scan_sequences)
+        register("RELOAD_CONFIG", self.reload_config_file)
+        register("CONFIG_PUSH", self.push_config, "json")
+        register("LOG_DUMP", self.log_dump)
+        register("LOG_LEVEL", self.set_log_level, "level")
+        register("CMD_STATS", self.send_command_stats)
+    
+    # Command handlers
+    
+    def home_all(self):
+        self.hardware.home_all_axes()
+        return True
+    
+    def home_axis(self, index):
+        if not 0 <= index < len(self.hardware.axes):
+            self.debug_log("Invalid axis index: %d", index)
+            return False
+        self.hardware.home_single_axis(index)
+        return True
+    
+    def restart_playback(self):
+        # Handed to whichever mode is active
+        return self.events.put((EVENT_RESTART, None))
+    
+    def set_mode(self, mode_index):
+        self.debug_log("Mode change requested: %d", mode_index)
+        return self.events.put((EVENT_MODE, mode_index))
+    
+    def set_speed(self, speed):
+        limiter = self.hardware.playback_limiter
+        if limiter is None:
+            return False
+        return limiter.set_override(speed)
+    
+    def list_sequences(self):
+        # The listing as of the last scan; walking the filesystem is left to SCAN_SEQUENCES
+        if self.library is None:
+            return False
+        self.hardware.uart.write("SEQUENCES:" + json.dumps(self.library.listing()) + "\n")
+        return True
+    
+    def scan_sequences(self):
+        """Pick up CSVs copied in since boot, then send the listing with the scan's duration"""
+        if self.library is None:
+            return False
+        self.library.scan()
+        return self.list_sequences()
+    
+    def select_sequence(self, name):
+        if self.library is None:
+            return False
+        return self.library.select(name)
+    
+    def reload_config_file(self):
+        if self.config_manager is None:
+            return False
+        try:
+            config_data = self.config_manager.read_config()
+        except Exception as e:
+            log.warn("Config reload failed: %s", e)
+            return False
+        return self.reload_config(config_data)
+    
+    def push_config(self, config_data):
+        if self.config_manager is None:
+            return False
+        if not self.reload_config(config_data):
+            return False
+        try:
+            # Saved after it applied, so a table the board rejects never reaches flash
+            self.config_manager.save_config(config_data)
+        except OSError as e:
+            log.warn("Pushed config not saved: %s", e)
+        return True
+    
+    def log_dump(self):
+        log.dump(self.hardware.uart.write)
+        return True
+    
+    def set_log_level(self, level):
+        log.set_level(level)
+        return True
+    
+    def send_command_stats(self):
+        """Per-command call count and min/max/mean handling time"""
+        self.hardware.uart.write_json("CMD_STATS:", self.commands.stats())
+        return True
+    
+    def reload_config(self, config_data):
+        """Hot-reload an axis table and tell the host what it now looks like"""
+        if not valid_config(config_data):
+            log.warn("Rejected axis table")
+            return False
+        started = time.ticks_us()
+        changes = self.config_manager.apply_config(config_data)
+        elapsed = time.ticks_diff(time.ticks_us(), started)
+        # Rebuilt from the new table by the next STATUS
+        self.status = None
+        log.info("Config reloaded in %dus", elapsed)
+        self.send_axes(changes, elapsed)
+        return True
+    
+    def send_axes(self, changes, reload_us):
+        """Axis metadata after a reload, with what changed and how long the swap took"""
+        axes = []
+        for axis, cfg in zip(self.hardware.axes, self.config_manager.config):
+            axes.append({
+                "name": axis["name"],
+                "pin": cfg["pin"],
+                "min": axis["min"],
+                "max": axis["max"],
+                "home": axis["home"],
+                "sensor_addr": axis["sensor_addr"],
+                "max_speed": axis["max_speed"],
+                "max_accel": axis["max_accel"]
+                })
+        self.hardware.uart.write_json("AXES:", {"axes": axes, "changes": changes, "reload_us": reload_us})
+    
+    def send_ack(self, cmd, ok):
+        """Acknowledge a command with the device time it finished"""
+        ack = json.dumps({"cmd": cmd, "ok": ok, "t": time.ticks_ms()})
+        self.hardware.uart.write("ACK:" + ack + "\n")
+    
+    def send_pong(self, argument):
+        """Answer PING:<seq>:<host_time> with the echo plus receive and send device times"""
+        parts = argument.split(":")
+        if len(parts) != 2:
+            log.warn("Invalid PING command format")
+            return None
+        self.hardware.uart.write(f"PONG:{parts[0]}:{parts[1]}:{self.line_time}:{time.ticks_ms()}\n")
+        return None
             
-    def send_status(self, current_mode, current_reading, overloaded, current_frame, total_frames):
-        status = {
-            "mode": current_mode.name,
-            "axes": [],
-            "current": current_reading,
-            "overloaded": overloaded
+    def send_status(self, current_mode, current_reading, overloaded, current_frame, total_frames, loop=None):
+        self.write_status(self.status_snapshot(current_mode, current_reading, overloaded,
+                                               current_frame, total_frames, loop))
+    
+    def status_snapshot(self, current_mode, current_reading, overloaded, current_frame, total_frames, loop=None):
+        """Everything STATUS needs from the motion side, captured at one instant"""
+        scheduler = self.hardware.scheduler
+        return (
+            time.ticks_ms(),
+            current_mode.name,
+            current_reading,
+            overloaded,
+            current_frame,
+            total_frames,
+            scheduler.predicted_current if scheduler else None,
+            [axis["servo"].value() for axis in self.hardware.axes],
+            loop
+        )
+    
+    def build_status(self, count):
+        """Allocate the STATUS dicts once per axis table instead of once per STATUS"""
+        self.status_axes = []
+        for axis in self.hardware.axes[:count]:
+            self.status_axes.append({
+                "name": axis["name"],
+                "position": 0.0,
+                "measured": None,
+                "min": axis["min"],
+                "max": axis["max"],
+                "home": axis["home"]
+                })
+        self.status = {
+            "mode": "",
+            "axes": self.status_axes,
+            "current": 0.0,
+            "overloaded": False,
+            "t": 0
         }
+    
+    def write_status(self, snapshot, core1=None):
+        """Encode and send a snapshot; core1 is the comms core's loop report, if any"""
+        # A config reload swaps the axis table on core 0 under adc_lock, and a
+        # snapshot taken before it can still be sized for the old table
+        lock = self.hardware.adc_lock
+        if lock:
+            lock.acquire()
+        try:
+            status = self.fill_status(snapshot, core1)
+        finally:
+            if lock:
+                lock.release()
+        # Streamed straight to the port rather than built as one string
+        self.hardware.uart.write_json("STATUS:", status)
+        #self.hardware.uart.stdout.flush()
+
+    def fill_status(self, snapshot, core1):
+        """Copy a snapshot into the reused STATUS dicts; returns the top-level one"""
+        t, mode, current_reading, overloaded, current_frame, total_frames, predicted, positions, loop = snapshot
+        if self.status is None or len(self.status_axes) != len(positions):
+            self.build_status(len(positions))
+        status = self.status
+        status["mode"] = mode
+        status["current"] = current_reading
+        status["overloaded"] = overloaded
+        status["t"] = t
+        
+        if self.boot_profile:
+            self.boot_profile.mark("first_status")
+            status["boot"] = self.boot_profile.report()
+            self.boot_profile = None
+        else:
+            status.pop("boot", None)
+        
+        if predicted is not None:
+            status["predicted_current"] = predicted
+        
+        # Per-core busy share and loop jitter
+        if loop is not None:
+            if core1 is None:
+                cores = self.one_core
+            else:
+                cores = self.two_cores
+                cores[1] = core1
+            cores[0] = loop
+            status["cores"] = cores
+        
+        if self.gc_monitor:
+            status["gc"] = self.gc_monitor.report()
+        
+        if self.hardware.estop:
+            status["estop"] = self.hardware.estop.latched
         
         # Add frame info only in PLAYBACK mode
-        if current_mode.name == "PLAYBACK":
+        if mode == "PLAYBACK":
             status["frame"] = current_frame
             status["total_frames"] = total_frames
+            limiter = self.hardware.playback_limiter
+            if limiter:
+                status["speed"] = limiter.override
+                status["rate"] = limiter.rate
+        else:
+            status.pop("frame", None)
+            status.pop("total_frames", None)
+            status.pop("speed", None)
+            status.pop("rate", None)
         
-        for axis in self.hardware.axes:
-            status["axes"].append({
-                "name": axis["name"],
-                "position": axis["servo"].value(),
-                "min": axis["min"],
-                "max": axis["max"],
-                "home": axis["home"]
-                })
-            
-        json_status = json.dumps(status)
-        self.hardware.uart.write(("STATUS:" + json_status + "\n"))
-        #self.hardware.uart.stdout.flush()
\ No newline at end of file
+        scanner = self.hardware.scanner
+        for index, axis_status in enumerate(self.status_axes):
+            axis_status["position"] = positions[index]
+            axis_status["measured"] = scanner.measured(index) if scanner else None
+        return status
\ No newline at end of file
@@ -1,24 +1,44 @@
 from servo import Calibration, Servo, servo2040
 import time
 import json
+from array import array
+import struct
 import uos
 
+CONFIG_FILE = 'config.json'
+CONFIG_CACHE_FILE = 'config.bin'
+CONFIG_CACHE_MAGIC = b'CFG2'
+
+# Header: magic, source size, source mtime, axis count
+CACHE_HEADER = '<4sIIH'
+# Per axis after the name: pin, sensor_addr, pulse_min, pulse_max,
+# min, max, home, max_speed, max_accel, sensor_min_v, sensor_max_v
+CACHE_AXIS = '<hhhhfffffff'
+
+# Optional float keys are stored as NaN when absent
+OPTIONAL_KEYS = ("max_speed", "max_accel", "sensor_min_v", "sensor_max_v")
+
+# Default calibration pulse pair (us) used when an axis doesn't set its own
+DEFAULT_PULSE_MIN = 1000
+DEFAULT_PULSE_MAX = 2000
+
+# Keys a pushed axis must have
+REQUIRED_KEYS = ("name", "pin", "min_value", "max_value", "home_value")
+
 class ConfigManager:
     def __init__(self, hardware, debug_log):
-        print("__init__ of config manager")
         self.hardware = hardware
         self.debug_log = debug_log
+        # The axis table the current hardware.axes was built from
+        self.config = []
+        self.debug_log("__init__ of config manager")
         
     def load_config(self):
         self.debug_log("Loading configuration...")
-        filename='config.json'
         try:
-            with open(filename, 'r') as f:
-                config = json.load(f)
-                self.debug_log(f"Loaded config: {len(config)} axes")
-                return config
+            return self.read_config()
         except Exception as e:
-            self.debug_log(f"Config error: {str(e)}")
+            self.debug_log("Config error: %s", e)
             # Create default config
             default_config = [
                 {"name": f"Axis {i+1}", "pin": i, 
@@ -29,50 +49,311 @@ class ConfigManager:
             self.debug_log("Using default configuration")
             return default_config
             
+    def read_config(self):
+        """config.json (or its cache when current); raises if it can't be read"""
+        filename=CONFIG_FILE
+        stat = uos.stat(filename)
+        config = self.read_config_cache(stat)
+        if config is not None:
+            self.debug_log("Loaded cached config: %d axes", len(config))
+            return config
+        with open(filename, 'r') as f:
+            config = json.load(f)
+            self.debug_log("Loaded config: %d axes", len(config))
+        self.write_config_cache(config, stat)
+        return config
+            
+    def read_config_cache(self, stat):
+        """Return the cached config if it was built from this config.json, else None"""
+        try:
+            with open(CONFIG_CACHE_FILE, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            magic, size, mtime, count = struct.unpack_from(CACHE_HEADER, data, 0)
+            if magic != CONFIG_CACHE_MAGIC or size != stat[6] or mtime != stat[8]:
+                self.debug_log("Config cache is stale, rebuilding")
+                return None
+            offset = struct.calcsize(CACHE_HEADER)
+            axis_size = struct.calcsize(CACHE_AXIS)
+            config = []
+            for _ in range(count):
+                name_len = data[offset]
+                name = data[offset + 1:offset + 1 + name_len].decode('utf-8')
+                offset += 1 + name_len
+                fields = struct.unpack_from(CACHE_AXIS, data, offset)
+                offset += axis_size
+                cfg = {
+                    "name": name,
+                    "pin": fields[0],
+                    "sensor_addr": fields[1],
+                    "pulse_min": fields[2],
+                    "pulse_max": fields[3],
+                    "min_value": _number(fields[4]),
+                    "max_value": _number(fields[5]),
+                    "home_value": _number(fields[6])
+                }
+                for key, value in zip(OPTIONAL_KEYS, fields[7:]):
+                    if value == value:  # NaN marks an absent key
+                        cfg[key] = value
+                config.append(cfg)
+            return config
+        except Exception as e:
+            self.debug_log("Config cache unreadable: %s", e)
+            return None
+
+    def write_config_cache(self, config, stat):
+        """Store config (with calibration pairs resolved) in the binary cache"""
+        try:
+            parts = [struct.pack(CACHE_HEADER, CONFIG_CACHE_MAGIC, stat[6], stat[8], len(config))]
+            for i, cfg in enumerate(config):
+                name = cfg["name"].encode('utf-8')
+                parts.append(bytes([len(name)]) + name)
+                optional = [cfg.get(key) for key in OPTIONAL_KEYS]
+                parts.append(struct.pack(CACHE_AXIS,
+                                         cfg["pin"], cfg.get("sensor_addr", i),
+                                         cfg.get("pulse_min", DEFAULT_PULSE_MIN),
+                                         cfg.get("pulse_max", DEFAULT_PULSE_MAX),
+                                         cfg["min_value"], cfg["max_value"], cfg["home_value"],
+                                         *[float('nan') if v is None else v for v in optional]))
+            with open(CONFIG_CACHE_FILE, 'wb') as f:
+                for part in parts:
+                    f.write(part)
+            self.debug_log("Config cache written")
+        except Exception as e:
+            self.debug_log("Config cache write failed: %s", e)
+
     def create_axes(self, config_data):
         self.debug_log("Creating axes from configuration...")
         for i, cfg in enumerate(config_data):
-            # Create calibration
-            cal = Calibration()
-            cal.apply_two_pairs(1000, 2000, cfg["min_value"], cfg["max_value"])
-            self.debug_log(f"  Calibration for {cfg['name']}: min={cfg['min_value']}°, max={cfg['max_value']}°")
-            
-            # Create servo
-            servo = Servo(cfg["pin"], cal)
-            
-            # Get sensor address (default to index)
-            sensor_addr = cfg.get("sensor_addr", i)
-            
-            self.hardware.axes.append({
-                "name": cfg["name"],
-                "servo": servo,
-                "home": cfg["home_value"],
-                "min": cfg["min_value"],
-                "max": cfg["max_value"],
-                "sensor_addr": sensor_addr
-            })
-            self.debug_log(f"  Created axis {i}: {cfg['name']} on pin {cfg['pin']}, sensor: {sensor_addr}")
+            servo = Servo(cfg["pin"], self.calibration(cfg))
+            axis = self.axis_fields(cfg, i)
+            axis["servo"] = servo
+            self.hardware.axes.append(axis)
+            self.debug_log("  Created axis %d: %s on pin %d, sensor: %d", i, cfg['name'], cfg['pin'], axis["sensor_addr"])
             
+        self.config = config_data
         self.debug_log("All axes created")
         
-    def load_sequence(self, filename='sequence.csv'):
+    def calibration(self, cfg):
+        cal = Calibration()
+        cal.apply_two_pairs(*calibration_inputs(cfg))
+        self.debug_log("  Calibration for %s: min=%s°, max=%s°", cfg['name'], cfg['min_value'], cfg['max_value'])
+        return cal
+        
+    def axis_fields(self, cfg, index):
+        """Everything in an axis entry except its servo"""
+        return {
+            "name": cfg["name"],
+            "home": cfg["home_value"],
+            "min": cfg["min_value"],
+            "max": cfg["max_value"],
+            # Sensor address defaults to the axis index
+            "sensor_addr": cfg.get("sensor_addr", index),
+            "max_speed": cfg.get("max_speed"),
+            "max_accel": cfg.get("max_accel"),
+            "sensor_min_v": cfg.get("sensor_min_v"),
+            "sensor_max_v": cfg.get("sensor_max_v")
+        }
+        
+    def reload_axes(self, config_data):
+        """Apply a new axis table in place, rebuilding only what changed
+
+        A new pin gets a new Servo, new limits or pulses a new Calibration on
+        the existing one; anything else is a field update. Servos that were
+        enabled are put back at their position (clamped to the new limits)
+        and stay enabled. Added axes stay off until they are homed.
+
+        Every servo leaving its pin is disabled before any new Servo is made,
+        so axes can swap pins, and the new Servos are all built before the
+        table is touched: if one fails the old servos are re-enabled and the
+        table is left as it was.
+        """
+        axes = self.hardware.axes
+        old_config = self.config
+        changes = {"rebuilt": 0, "recalibrated": 0, "updated": 0, "added": 0, "removed": 0}
+        kept = min(len(axes), len(config_data))
+        moved = []
+        recalibrate = []
+        restore = {}  # index -> value to put an enabled servo back at
+        for i in range(kept):
+            cfg = config_data[i]
+            old = old_config[i]
+            if cfg["pin"] != old["pin"]:
+                moved.append(i)
+            elif calibration_inputs(cfg) != calibration_inputs(old):
+                recalibrate.append(i)
+            else:
+                continue
+            servo = axes[i]["servo"]
+            if servo.is_enabled():
+                restore[i] = min(max(servo.value(), cfg["min_value"]), cfg["max_value"])
+        # Free every pin being left before claiming any
+        released = [axes[i]["servo"] for i in moved] + [axis["servo"] for axis in axes[kept:]]
+        enabled = [servo for servo in released if servo.is_enabled()]
+        for servo in released:
+            servo.disable()
+        servos = {}
+        try:
+            for i in moved + list(range(kept, len(config_data))):
+                cfg = config_data[i]
+                servos[i] = Servo(cfg["pin"], self.calibration(cfg))
+        except Exception:
+            for servo in servos.values():
+                servo.disable()
+            for servo in enabled:
+                servo.enable()
+            raise
+        for i, cfg in enumerate(config_data):
+            fields = self.axis_fields(cfg, i)
+            if i >= kept:
+                fields["servo"] = servos[i]
+                axes.append(fields)
+                changes["added"] += 1
+                continue
+            axis = axes[i]
+            if i in servos:
+                fields["servo"] = servos[i]
+                changes["rebuilt"] += 1
+            elif i in recalibrate:
+                axis["servo"].calibration(self.calibration(cfg))
+                changes["recalibrated"] += 1
+            elif any(axis[key] != value for key, value in fields.items()):
+                changes["updated"] += 1
+            if i in restore:
+                fields.get("servo", axis["servo"]).value(restore[i])
+            # Updated in place: the scheduler, scanner and STATUS hold this list
+            axis.update(fields)
+        while len(axes) > len(config_data):
+            axes.pop()
+            changes["removed"] += 1
+        self.config = config_data
+        self.debug_log("Axes reloaded: %s", changes)
+        return changes
+        
+    def apply_config(self, config_data):
+        """Hot-reload an axis table and resync everything sized by hardware.axes"""
+        hardware = self.hardware
+        # Core 1 samples the mux by axis; keep it off the table while it changes
+        lock = hardware.adc_lock
+        if lock:
+            lock.acquire()
+        try:
+            changes = self.reload_axes(config_data)
+            for component in (hardware.scheduler, hardware.scanner, hardware.playback_limiter):
+                if component:
+                    component.sync()
+        finally:
+            if lock:
+                lock.release()
+        return changes
+        
+    def save_config(self, config_data):
+        """Write a pushed axis table to config.json and refresh the binary cache"""
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump(config_data, f)
+        self.write_config_cache(config_data, uos.stat(CONFIG_FILE))
+        
+    def load_sequence(self, filename='sequence.csv', frame_rate=30):
+        """Parse a sequence CSV into (frames, times) with times in ms from the start
+
+        A row is either one value per axis, or a timing column first: a plain
+        number is the frame's timestamp in ms, "+n" is a duration of n ms after
+        the previous frame. Rows without timing follow 1/frame_rate after the
+        previous frame.
+        """
         self.debug_log("Loading sequence...")
         sequence = []
+        times = array('l')
+        frame_period = 1000 / frame_rate
+        t = 0.0
         try:
-            if filename in uos.listdir():
+            if self.file_exists(filename):
                 with open(filename, 'r') as f:
+                    axis_count = len(self.hardware.axes)
                     for line_num, line in enumerate(f):
                         try:
-                            frame = [float(x.strip()) for x in line.split(',')]
-                            if len(frame) == len(self.hardware.axes):
-                                sequence.append(frame)
+                            fields = line.split(',')
+                            frame = [float(x.strip()) for x in fields]
+                            if len(frame) == axis_count:
+                                if sequence:
+                                    t += frame_period
+                            elif len(frame) == axis_count + 1:
+                                if fields[0].strip().startswith('+'):
+                                    t += frame[0]
+                                elif frame[0] < t:
+                                    self.debug_log("Timestamp going backwards on line %d", line_num)
+                                else:
+                                    t = frame[0]
+                                frame = frame[1:]
                             else:
-                                self.debug_log(f"Invalid frame on line {line_num}: expected {len(self.hardware.axes)} values, got {len(frame)}")
+                                self.debug_log("Invalid frame on line %d: expected %d values, got %d", line_num, len(self.hardware.axes), len(frame))
+                                continue
+                            sequence.append(frame)
+                            times.append(int(t + 0.5))
                         except ValueError:
-                            self.debug_log(f"Invalid number in frame on line {line_num}")
-                    self.debug_log(f"Loaded sequence: {len(sequence)} frames")
+                            self.debug_log("Invalid number in frame on line %d", line_num)
+                    self.debug_log("Loaded sequence: %d frames, %d ms", len(sequence), int(t))
             else:
-                self.debug_log(f"Sequence file {filename} not found")
+                self.debug_log("Sequence file %s not found", filename)
         except Exception as e:
-            self.debug_log(f"Sequence error: {str(e)}")
-        return sequence
\ No newline at end of file
+            self.debug_log("Sequence error: %s", e)
+        return sequence, times
+    
+    def file_exists(self, filename):
+        # stat works for paths in subdirectories (the sequence library), listdir() only here
+        try:
+            uos.stat(filename)
+            return True
+        except OSError:
+            return False
+
+def _number(value):
+    """Give whole floats back as ints so cached and parsed config look the same"""
+    return int(value) if value == int(value) else value
+
+def calibration_inputs(cfg):
+    """The pulse/angle pairs a Calibration is built from, defaults resolved"""
+    return (cfg.get("pulse_min", DEFAULT_PULSE_MIN), cfg.get("pulse_max", DEFAULT_PULSE_MAX),
+            cfg["min_value"], cfg["max_value"])
+
+def _is_number(value):
+    # bool is an int subclass but never a sensible limit or pin
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def valid_config(config_data):
+    """True if config_data looks like an axis table config.json could hold
+
+    Checked in full before anything is applied, since a bad value found
+    halfway through reload_axes would leave the table half-changed.
+    """
+    if not isinstance(config_data, list) or not config_data:
+        return False
+    pins = set()
+    for cfg in config_data:
+        if not isinstance(cfg, dict):
+            return False
+        for key in REQUIRED_KEYS:
+            if key not in cfg:
+                return False
+        if not isinstance(cfg["name"], str):
+            return False
+        pin = cfg["pin"]
+        if not isinstance(pin, int) or isinstance(pin, bool) or not 0 <= pin < servo2040.NUM_SERVOS \
+                or pin in pins:
+            return False
+        pins.add(pin)
+        for key in ("min_value", "max_value", "home_value"):
+            if not _is_number(cfg[key]):
+                return False
+        # Packed as shorts in the config cache
+        for key in ("pulse_min", "pulse_max", "sensor_addr"):
+            if key in cfg and not (_is_number(cfg[key]) and cfg[key] == int(cfg[key])):
+                return False
+        for key in OPTIONAL_KEYS:
+            if cfg.get(key) is not None and not _is_number(cfg[key]):
+                return False
+        if cfg["min_value"] >= cfg["max_value"]:
+            return False
+    return True
\ No newline at end of file
@@ -0,0 +1,606 @@
+"""Virtual Servo2040 on a pseudo-terminal, for exercising the GUI and client without a board.
+
+    python device_emulator.py --rate 100 --link /tmp/servo2040
+    python device_emulator.py --rate 1000 --noise 0.5 --garbage 0.01 --disconnect-every 20
+
+Speaks the line protocol of communication.py (STATUS, ACK, PONG, LOG,
+LOG_DUMP, SEQUENCES, AXES and CMD_STATS lines and the same command set)
+and moves simulated axes at the scheduler's default speeds, drawing
+current like its default model.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import OrderedDict
+
+from commands import CommandRegistry
+from estop import ESTOP_BYTE, RESUME_BYTE
+from logger import LEVEL_NAMES, LOG_PREFIX, DUMP_PREFIX
+from motion_scheduler import DEFAULT_MAX_SPEED, DEFAULT_CURRENT_GAIN, DEFAULT_IDLE_CURRENT
+from playback_limiter import SPEED_MIN, SPEED_MAX
+
+MODES = ["HOME", "JOG", "PLAYBACK"]
+TICKS_PERIOD = 1 << 30          # ticks_ms wraps here on the RP2040
+PLAYBACK_FRAMES = 300
+SEQUENCES = {"sequence": PLAYBACK_FRAMES, "pick_place": 180, "wave": 600}  # name -> frames
+PLAYBACK_RATE = 30              # frames per second
+MOTION_PERIOD = 0.01            # s between simulated motion steps
+SENT_TIMES_MAX = 4096           # STATUS send times kept for latency lookups
+WRITE_TIMEOUT = 0.1             # s to finish a line once the pty buffer is full
+
+
+def load_axes(filename="config.json"):
+    """Axis names, limits and homes from the firmware's config.json"""
+    with open(filename) as f:
+        return axes_from_config(json.load(f))
+
+
+def axes_from_config(config):
+    return [{
+        "name": axis["name"],
+        "pin": axis["pin"],
+        "min": axis["min_value"],
+        "max": axis["max_value"],
+        "home": axis["home_value"],
+        "sensor_addr": axis.get("sensor_addr", index),
+        "max_speed": axis.get("max_speed") or DEFAULT_MAX_SPEED,
+        "max_accel": axis.get("max_accel"),
+    } for index, axis in enumerate(config)]
+
+
+class VirtualServo2040:
+    """Emulated board behind a pty; connect a client to .path (or the symlink)"""
+
+    def __init__(self, axes, status_rate=10, noise=0.0, garbage=0.0,
+                 disconnect_every=None, downtime=1.0, link=None, record=None, config=None):
+        self.axes = axes
+        self.config = config  # file RELOAD_CONFIG re-reads; pushed tables are only kept in memory
+        self.table_lock = threading.Lock()  # held while the axis lists are read or swapped
+        self.status_rate = status_rate
+        self.noise = noise
+        self.garbage = garbage
+        self.disconnect_every = disconnect_every
+        self.downtime = downtime
+        self.link = link
+        self.record_file = open(record, "a") if record else None
+
+        self.positions = [axis["home"] for axis in axes]
+        self.targets = [None] * len(axes)
+        self.speeds = [0.0] * len(axes)
+        self.mode = 0
+        self.playback_position = 0.0    # s into the sequence, advanced at self.speed
+        self.speed = 1.0
+        self.sequences = dict(SEQUENCES)
+        self.selected = "sequence"
+        self.scan_us = 0                # the simulated library has no files to walk
+        self.booted = time.monotonic()
+        self.log_level = LEVEL_NAMES["INFO"]
+        self.sent_boot = False
+        self.latched = False
+        self.estop_count = 0
+
+        # Counters and records read by the load-test harness
+        self.commands = []
+        self.command_table = CommandRegistry()
+        self.register_commands()
+        self.line_time = 0          # ticks_ms the last command line arrived, for PONG
+        self.status_sent = 0
+        self.status_blocked = 0     # not sent because the host wasn't draining the pty
+        self.garbage_sent = 0
+        self.disconnects = 0
+        # STATUS seq -> host send time; ticks_ms repeats within a ms at high rates
+        self.sent_times = OrderedDict()
+        self.status_seq = 0
+
+        self.master = None
+        self.slave = None
+        self.path = None
+        self.write_lock = threading.Lock()
+        self.running = False
+        self.threads = []
+
+    def ticks_ms(self):
+        return int((time.monotonic() - self.booted) * 1000) % TICKS_PERIOD
+
+    def host_time(self, ticks):
+        """Host time.monotonic() at which the emulator's ticks_ms read `ticks`"""
+        return self.booted + ticks / 1000
+
+    def open_port(self):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        # A host that stops reading must not block the emulator
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        if self.link:
+            # Point the stable name at the new pty, as a re-enumerated board would be
+            try:
+                os.remove(self.link)
+            except FileNotFoundError:
+                pass
+            os.symlink(self.path, self.link)
+
+    def close_port(self):
+        with self.write_lock:
+            for fd in (self.master, self.slave):
+                try:
+                    os.close(fd)
+                except (OSError, TypeError):
+                    pass
+            self.master = None
+            self.slave = None
+
+    def start(self):
+        self.open_port()
+        self.running = True
+        for target in (self.read_loop, self.status_loop, self.motion_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        if self.disconnect_every:
+            thread = threading.Thread(target=self.disconnect_loop, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self.path
+
+    def stop(self):
+        self.running = False
+        self.close_port()
+        if self.link:
+            try:
+                os.remove(self.link)
+            except FileNotFoundError:
+                pass
+        if self.record_file:
+            self.record_file.close()
+
+    def write(self, text):
+        """Write a whole line, or nothing if the pty buffer is full; returns whether it went out"""
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        with self.write_lock:
+            if self.master is None:
+                return False
+            try:
+                written = os.write(self.master, data)
+            except OSError:
+                # Full (BlockingIOError) or gone
+                return False
+            # Finish a partly written line so the host never sees it cut short
+            deadline = time.monotonic() + WRITE_TIMEOUT
+            while written < len(data) and time.monotonic() < deadline:
+                try:
+                    written += os.write(self.master, data[written:])
+                except BlockingIOError:
+                    time.sleep(0.001)
+                except OSError:
+                    return False
+            return written == len(data)
+
+    def log(self, level, message):
+        if LEVEL_NAMES[level] >= self.log_level:
+            self.write(f"{LOG_PREFIX}{self.ticks_ms()} {level[0]} {message}\n")
+
+    # Command side
+
+    def read_loop(self):
+        buffer = b""
+        while self.running:
+            master = self.master
+            if master is None:
+                time.sleep(0.01)
+                continue
+            try:
+                # Never block in read: a disconnect closes the fd from another thread
+                readable, _, _ = select.select([master], [], [], 0.05)
+                if not readable:
+                    continue
+                data = os.read(master, 1024)
+            except BlockingIOError:
+                continue
+            except (OSError, ValueError):
+                # Closed under us by a simulated disconnect
+                buffer = b""
+                time.sleep(0.01)
+                continue
+            if ESTOP_BYTE in data or RESUME_BYTE in data:
+                data = self.handle_control(data)
+            buffer += data
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                line_time = self.ticks_ms()
+                cmd = raw.decode("utf-8", errors="replace").strip()
+                if cmd:
+                    self.record(cmd, line_time)
+                    self.line_time = line_time
+                    ok = self.process_command(cmd)
+                    if ok is not None:
+                        self.send_ack(cmd, ok)
+
+    def handle_control(self, data):
+        """Act on E-STOP/RESUME bytes ahead of line parsing; returns the other bytes"""
+        kept = bytearray()
+        for byte in data:
+            if byte == ESTOP_BYTE:
+                received = time.monotonic()
+                self.targets = [None] * len(self.axes)
+                self.speeds = [0.0] * len(self.axes)
+                if not self.latched:
+                    self.estop_count += 1
+                self.latched = True
+                latency = int((time.monotonic() - received) * 1e6)
+                self.record("<E-STOP>", self.ticks_ms())
+                self.send_estop("stopped", latency)
+                self.log("WARN", f"E-STOP: servos off {latency}us after the byte was read")
+            elif byte == RESUME_BYTE:
+                self.latched = False
+                self.record("<RESUME>", self.ticks_ms())
+                self.send_estop("resumed", None)
+                self.log("INFO", "E-STOP released")
+            else:
+                kept.append(byte)
+        return bytes(kept)
+
+    def send_estop(self, state, latency):
+        self.write("ESTOP:" + json.dumps({"state": state, "t": self.ticks_ms(), "latency_us": latency,
+                                          "count": self.estop_count}) + "\n")
+
+    def record(self, cmd, line_time):
+        entry = {"t": line_time, "host": time.monotonic(), "cmd": cmd}
+        self.commands.append(entry)
+        if self.record_file:
+            self.record_file.write(json.dumps(entry) + "\n")
+            self.record_file.flush()
+
+    def register_commands(self):
+        """Communication.register_commands with emulated handlers; names and flags must match"""
+        register = self.command_table.register
+        register("PING", self.send_pong, "text", local=True)
+        register("HOME_ALL", self.home_all, motion=True)
+        register("HOME_AXIS", self.home_axis, "int", motion=True)
+        register("RESTART_PLAYBACK", self.restart_playback, motion=True)
+        register("SET_MODE", self.set_mode, "int", motion=True)
+        register("SELECT_SEQUENCE", self.select_sequence, "text", motion=True)
+        register("SPEED", self.set_speed, "float")
+        register("LIST_SEQUENCES", self.list_sequences)
+        register("SCAN_SEQUENCES", self.scan_sequences)
+        register("RELOAD_CONFIG", self.reload_config_file)
+        register("CONFIG_PUSH", self.apply_config, "json")
+        register("LOG_DUMP", self.log_dump)
+        register("LOG_LEVEL", self.set_log_level, "level")
+        register("CMD_STATS", self.send_command_stats)
+
+    def process_command(self, cmd):
+        """Same replies as Communication.process_command"""
+        command, argument = self.command_table.lookup(cmd)
+        if command is None:
+            self.command_table.unknown += 1
+            self.log("WARN", f"Unknown command: {cmd}")
+            return False
+        started = time.perf_counter()
+        ok = self.run_command(command, argument, cmd)
+        command.record(int((time.perf_counter() - started) * 1e6))
+        return ok
+
+    def run_command(self, command, argument, cmd):
+        if command.motion and self.latched:
+            self.log("WARN", f"E-STOP latched, refused: {cmd}")
+            return False
+        if command.parse is None:
+            if argument is not None:
+                self.log("WARN", f"{command.name} takes no argument")
+                return False
+            return command.handler()
+        try:
+            if argument is None:
+                raise ValueError("missing argument")
+            value = command.parse(argument)
+        except ValueError:
+            self.log("WARN", f"Invalid {command.name} command format")
+            return False
+        return command.handler(value)
+
+    # Command handlers
+
+    def send_pong(self, argument):
+        parts = argument.split(":")
+        if len(parts) != 2:
+            self.log("WARN", "Invalid PING command format")
+            return None
+        self.write(f"PONG:{parts[0]}:{parts[1]}:{self.line_time}:{self.ticks_ms()}\n")
+        return None
+
+    def home_all(self):
+        self.move_all([axis["home"] for axis in self.axes])
+        return True
+
+    def home_axis(self, index):
+        if not 0 <= index < len(self.axes):
+            return False
+        self.targets[index] = self.axes[index]["home"]
+        return True
+
+    def restart_playback(self):
+        self.playback_position = 0.0
+        return True
+
+    def set_mode(self, mode):
+        if 0 <= mode < len(MODES):
+            self.mode = mode
+            self.log("INFO", f"Entered {MODES[mode]} mode")
+            if MODES[mode] == "PLAYBACK":
+                self.playback_position = 0.0
+        return True
+
+    def set_speed(self, speed):
+        if not SPEED_MIN <= speed <= SPEED_MAX:
+            return False
+        self.speed = speed
+        return True
+
+    def list_sequences(self):
+        listing = {
+            "selected": self.selected,
+            "sequences": [{"name": name, "frames": frames, "end_ms": (frames - 1) * 1000 // PLAYBACK_RATE}
+                          for name, frames in self.sequences.items()],
+            "cache": {"blocks": 0, "hits": 0, "misses": 0},
+            "scan_us": self.scan_us
+        }
+        self.write("SEQUENCES:" + json.dumps(listing) + "\n")
+        return True
+
+    def scan_sequences(self):
+        started = time.perf_counter()
+        self.sequences = dict(SEQUENCES)
+        self.scan_us = int((time.perf_counter() - started) * 1e6)
+        return self.list_sequences()
+
+    def select_sequence(self, name):
+        if name not in self.sequences:
+            self.log("DEBUG", f"Unknown sequence: {name}")
+            return False
+        self.selected = name
+        self.playback_position = 0.0
+        return True
+
+    def reload_config_file(self):
+        if self.config is None:
+            return False
+        try:
+            with open(self.config) as f:
+                return self.apply_config(json.load(f))
+        except (OSError, ValueError):
+            return False
+
+    def log_dump(self):
+        self.write(DUMP_PREFIX + "BEGIN\n")
+        for entry in self.commands[-20:]:
+            self.write(f"{DUMP_PREFIX}R {entry['t']} D Received command: {entry['cmd']}\n")
+        self.write(DUMP_PREFIX + "END\n")
+        return True
+
+    def set_log_level(self, level):
+        self.log_level = level
+        return True
+
+    def send_command_stats(self):
+        self.write("CMD_STATS:" + json.dumps(self.command_table.stats()) + "\n")
+        return True
+
+    def apply_config(self, config):
+        """Swap in a new axis table and report it like ConfigManager.reload_axes does"""
+        started = time.monotonic()
+        try:
+            axes = axes_from_config(config)
+        except (KeyError, TypeError, AttributeError):
+            return False
+        if not axes or any(axis["min"] >= axis["max"] for axis in axes):
+            return False
+        changes = {"rebuilt": 0, "recalibrated": 0, "updated": 0, "added": 0,
+                   "removed": max(0, len(self.axes) - len(axes))}
+        with self.table_lock:
+            positions = []
+            for index, axis in enumerate(axes):
+                if index >= len(self.axes):
+                    changes["added"] += 1
+                    positions.append(axis["home"])
+                    continue
+                old = self.axes[index]
+                if axis["pin"] != old["pin"]:
+                    changes["rebuilt"] += 1
+                elif (axis["min"], axis["max"]) != (old["min"], old["max"]):
+                    changes["recalibrated"] += 1
+                elif axis != old:
+                    changes["updated"] += 1
+                positions.append(max(axis["min"], min(axis["max"], self.positions[index])))
+            self.positions = positions
+            self.targets = [None] * len(axes)
+            self.speeds = [0.0] * len(axes)
+            self.axes = axes
+        reload_us = int((time.monotonic() - started) * 1e6)
+        report = [{key: axis[key] for key in ("name", "pin", "min", "max", "home", "sensor_addr",
+                                               "max_speed", "max_accel")} for axis in axes]
+        self.log("INFO", f"Config reloaded in {reload_us}us")
+        self.write("AXES:" + json.dumps({"axes": report, "changes": changes, "reload_us": reload_us}) + "\n")
+        return True
+
+    def send_ack(self, cmd, ok):
+        self.write("ACK:" + json.dumps({"cmd": cmd, "ok": ok, "t": self.ticks_ms()}) + "\n")
+
+    # Simulated motion
+
+    def move_all(self, values):
+        for index, value in enumerate(values):
+            axis = self.axes[index]
+            self.targets[index] = max(axis["min"], min(axis["max"], value))
+
+    def motion_loop(self):
+        last = time.monotonic()
+        while self.running:
+            time.sleep(MOTION_PERIOD)
+            now = time.monotonic()
+            dt = now - last
+            last = now
+            if self.latched:
+                continue
+            with self.table_lock:
+                self.step(now, dt)
+
+    def step(self, now, dt):
+        if MODES[self.mode] == "PLAYBACK":
+            # A slow sweep stands in for the sequence
+            self.playback_position += dt * self.speed
+            phase = 2 * math.pi * self.playback_position * PLAYBACK_RATE / self.sequences[self.selected]
+            for index, axis in enumerate(self.axes):
+                span = (axis["max"] - axis["min"]) / 4
+                self.targets[index] = axis["home"] + span * math.sin(phase + index)
+        for index, axis in enumerate(self.axes):
+            target = self.targets[index]
+            if target is None:
+                self.speeds[index] = 0.0
+                continue
+            remaining = target - self.positions[index]
+            step = axis["max_speed"] * dt
+            if abs(remaining) <= step:
+                self.positions[index] = target
+                self.targets[index] = None
+                self.speeds[index] = abs(remaining) / dt if dt > 0 else 0.0
+            else:
+                self.positions[index] += math.copysign(step, remaining)
+                self.speeds[index] = axis["max_speed"]
+
+    def current(self):
+        draw = DEFAULT_IDLE_CURRENT + sum(DEFAULT_CURRENT_GAIN * speed for speed in self.speeds)
+        return max(0.0, draw + random.gauss(0, self.noise / 100)) if self.noise else draw
+
+    # Status side
+
+    def status(self):
+        with self.table_lock:
+            return self.build_status()
+
+    def build_status(self):
+        t = self.ticks_ms()
+        mode = MODES[self.mode]
+        current = self.current()
+        status = {
+            "mode": mode,
+            "axes": [],
+            "current": current,
+            "overloaded": False,
+            "t": t
+        }
+        status["estop"] = self.latched
+        if not self.sent_boot:
+            status["boot"] = {"imports": 0.0, "total": 0.0}
+            self.sent_boot = True
+        status["predicted_current"] = DEFAULT_IDLE_CURRENT + sum(
+            DEFAULT_CURRENT_GAIN * speed for speed in self.speeds)
+        if mode == "PLAYBACK":
+            elapsed = self.playback_position
+            frames = self.sequences[self.selected]
+            status["frame"] = int(elapsed * PLAYBACK_RATE) % frames
+            status["total_frames"] = frames
+            status["speed"] = self.speed
+            status["rate"] = self.speed
+        for index, axis in enumerate(self.axes):
+            position = self.positions[index]
+            measured = position + random.gauss(0, self.noise) if self.noise else position
+            status["axes"].append({
+                "name": axis["name"],
+                "position": position,
+                "measured": measured,
+                "min": axis["min"],
+                "max": axis["max"],
+                "home": axis["home"]
+            })
+        return status
+
+    def garbage_line(self):
+        """Either random bytes (not always valid UTF-8) or a STATUS cut short"""
+        if random.random() < 0.5:
+            return bytes(random.randrange(256) for _ in range(random.randint(1, 80))).replace(b"\n", b"") + b"\n"
+        line = "STATUS:" + json.dumps(self.status())
+        return (line[:random.randint(8, len(line) - 1)] + "\n").encode("utf-8")
+
+    def status_loop(self):
+        period = 1.0 / self.status_rate
+        deadline = time.monotonic()
+        while self.running:
+            deadline += period
+            status = self.status()
+            # Emulator-only field so the harness can tell every STATUS apart
+            self.status_seq += 1
+            seq = status["seq"] = self.status_seq
+            line = "STATUS:" + json.dumps(status) + "\n"
+            # Stamped before the write: a fast reader can parse the line before write() returns
+            self.sent_times[seq] = time.monotonic()
+            if len(self.sent_times) > SENT_TIMES_MAX:
+                self.sent_times.popitem(last=False)
+            if self.write(line):
+                self.status_sent += 1
+            else:
+                self.sent_times.pop(seq, None)
+                if self.master is not None:
+                    self.status_blocked += 1
+            if self.garbage and random.random() < self.garbage:
+                if self.write(self.garbage_line()):
+                    self.garbage_sent += 1
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind (the host isn't draining the pty); don't burst to catch up
+                deadline = time.monotonic()
+
+    def disconnect_loop(self):
+        while self.running:
+            time.sleep(self.disconnect_every)
+            if not self.running:
+                return
+            self.disconnects += 1
+            self.close_port()
+            time.sleep(self.downtime)
+            if self.running:
+                self.sent_boot = False
+                self.booted = time.monotonic()
+                self.open_port()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Virtual Servo2040 on a pseudo-terminal")
+    parser.add_argument("--config", default="config.json", help="axis table to emulate")
+    parser.add_argument("--rate", type=float, default=10, help="STATUS lines per second (10-1000)")
+    parser.add_argument("--noise", type=float, default=0.0,
+                        help="measured-position noise in degrees (current noise is 1/100 of it in A)")
+    parser.add_argument("--garbage", type=float, default=0.0,
+                        help="chance per STATUS of also sending a corrupt line")
+    parser.add_argument("--disconnect-every", type=float, help="drop the port every N seconds")
+    parser.add_argument("--downtime", type=float, default=1.0, help="seconds the port stays gone")
+    parser.add_argument("--link", help="symlink kept pointing at the current pty")
+    parser.add_argument("--record", help="append received commands to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    device = VirtualServo2040(load_axes(args.config), args.rate, args.noise, args.garbage,
+                              args.disconnect_every, args.downtime, args.link, args.record, args.config)
+    path = device.start()
+    print(f"Virtual Servo2040 on {path}" + (f" (linked as {args.link})" if args.link else ""), flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.stop()
+        print(f"{device.status_sent} STATUS sent, {len(device.commands)} commands received, "
+              f"{device.garbage_sent} garbage lines, {device.disconnects} disconnects")
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import _thread
+import time
+from utilities import log, LoopStats
+
+# Slots in the rings between the cores; allocated once at startup
+COMMAND_SLOTS = 16
+STATUS_SLOTS = 2
+
+CORE1_PERIOD_US = 2000  # comms/sampling loop period
+CORE1_STACK = 8 * 1024  # json.dumps of a STATUS needs more than the default
+STOP_TIMEOUT = 200      # ms to wait for core 1 at shutdown
+
+
+class RingBuffer:
+    """Fixed-size FIFO shared between the cores; slots are allocated once"""
+
+    def __init__(self, size):
+        self.slots = [None] * size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.lock = _thread.allocate_lock()
+
+    def put(self, item):
+        """Queue an item; returns False (and counts a drop) when full"""
+        with self.lock:
+            size = len(self.slots)
+            if self.count == size:
+                self.dropped += 1
+                return False
+            self.slots[(self.head + self.count) % size] = item
+            self.count += 1
+            return True
+
+    def get(self):
+        """Oldest item, or None when empty"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            item = self.slots[self.head]
+            self.slots[self.head] = None
+            self.head = (self.head + 1) % len(self.slots)
+            self.count -= 1
+            return item
+
+
+class DualCore:
+    """Runs serial I/O, command parsing, STATUS encoding and sensor sampling on core 1
+
+    Core 0 keeps modes, motion and current limiting. Commands reach it
+    through a ring drained by comm.run_queued(); STATUS snapshots go the
+    other way. Writes to the console and the shared ADC mux are locked.
+    """
+
+    def __init__(self, hardware, comm, debug_log):
+        self.hardware = hardware
+        self.comm = comm
+        self.debug_log = debug_log
+        self.commands = RingBuffer(COMMAND_SLOTS)
+        self.statuses = RingBuffer(STATUS_SLOTS)
+        self.stats = LoopStats()
+        self.running = False
+        self.stopped = True
+
+        # One writer at a time on the console, one reader at a time on the mux
+        write_lock = _thread.allocate_lock()
+        hardware.uart.lock = write_lock
+        log.write_lock = write_lock
+        log.lock = _thread.allocate_lock()
+        hardware.adc_lock = _thread.allocate_lock()
+        comm.command_queue = self.commands
+
+    def start(self):
+        self.running = True
+        self.stopped = False
+        _thread.stack_size(CORE1_STACK)
+        _thread.start_new_thread(self.core1_loop, ())
+        self.debug_log("Core 1 started")
+
+    def stop(self):
+        """Ask core 1 to finish its loop; needed before a soft reset"""
+        self.running = False
+        deadline = time.ticks_add(time.ticks_ms(), STOP_TIMEOUT)
+        while not self.stopped and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            time.sleep_ms(1)
+
+    def post_status(self, snapshot):
+        """Hand a STATUS snapshot from core 0 to the encoder on core 1"""
+        self.statuses.put(snapshot)
+
+    def core1_loop(self):
+        comm = self.comm
+        scanner = self.hardware.scanner
+        stats = self.stats
+        try:
+            while self.running:
+                stats.begin()
+                try:
+                    comm.process_incoming()
+                except Exception as e:
+                    log.error("Core 1 comm error: %s", e)
+                try:
+                    scanner.update()
+                except Exception as e:
+                    log.error("Sensor scan error: %s", e)
+                snapshot = self.statuses.get()
+                if snapshot is not None:
+                    try:
+                        comm.write_status(snapshot, stats.report())
+                    except Exception as e:
+                        log.error("Status update error: %s", e)
+                remaining = CORE1_PERIOD_US - stats.end()
+                if remaining > 0:
+                    time.sleep_us(remaining)
+        finally:
+            self.stopped = True
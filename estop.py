@@ -0,0 +1,30 @@
+import time
+
+# Single control bytes, acted on as soon as they are read and never part of a command line
+ESTOP_BYTE = 0x18   # CAN
+RESUME_BYTE = 0x16  # SYN
+
+
+class EmergencyStop:
+    """Latched stop: servos go off the moment the E-STOP byte is read and stay off until RESUME"""
+
+    def __init__(self, hardware, debug_log):
+        self.hardware = hardware
+        self.debug_log = debug_log
+        self.latched = False
+        self.count = 0
+        self.last_latency = None  # us from reading the byte to every servo disabled
+
+    def trigger(self, received_us):
+        """Disable all servos now; returns the read-to-disabled latency in us"""
+        self.hardware.disable_servos()
+        latency = time.ticks_diff(time.ticks_us(), received_us)
+        if not self.latched:
+            self.count += 1
+        self.latched = True
+        self.last_latency = latency
+        return latency
+
+    def release(self):
+        """Clear the latch; the main loop re-enables the servos on the motion core"""
+        self.latched = False
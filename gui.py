@@ -1,12 +1,18 @@
 import tkinter as tk
 import serial
-import json
-import threading
-from tkinter import ttk, messagebox, scrolledtext
+import queue
+from tkinter import ttk, messagebox, scrolledtext, filedialog
 import time
+import json
+from clock_sync import PING_INTERVAL
+from servo_client import ServoClient
+from teach import TeachRecorder, DEFAULT_TOLERANCE, reduce_keyframes, max_replay_error, save_sequence
+
+POLL_INTERVAL = 20   # ms between drains of the client event queue
+POLL_BATCH = 200     # events applied per drain, so a burst can't freeze the UI
 
 class ServoControlGUI:
-    def __init__(self, root):
+    def __init__(self, root, ports=None):
         self.root = root
         self.root.title("Servo2040 Control Panel")
         self.root.geometry("1200x800")
@@ -14,20 +20,38 @@ class ServoControlGUI:
         # Initialize axes list
         self.axes = []
         
-        # Serial connection
-        self.ser = None
+        # Serial connection; the client's callbacks run on its reader thread,
+        # so they only queue events for poll_client to apply on the Tk thread
+        self.client = ServoClient()
+        self.search_ports = ports  # None searches every serial port
         self.port_var = tk.StringVar(value="COM6")
-        self.baudrate = 115200
-        self.connected = False
-        self.rx_count = 0
-        self.tx_count = 0
+        self.events = queue.Queue()
+        self.client.on_line(lambda line, received: self.events.put(("line", line)))
+        self.client.on_status(lambda status: self.events.put(("status", status)))
+        self.client.on_connection(lambda connected, port: self.events.put(("connection", connected, port)))
         
         # Status variables
         self.conn_status_var = tk.StringVar(value="Disconnected")
         self.mode_var = tk.StringVar(value="Unknown")
         self.current_var = tk.StringVar(value="0.00A")
         self.frame_var = tk.StringVar(value="0/0")
+        self.speed_var = tk.StringVar(value="1.0")
+        self.rate_var = tk.StringVar(value="--")
         self.overload_var = tk.StringVar(value="Normal")
+        self.estop_var = tk.StringVar(value="Clear")
+        self.sequence_var = tk.StringVar(value="")
+        
+        # Link timing
+        self.rtt_var = tk.StringVar(value="--")
+        self.latency_var = tk.StringVar(value="--")
+        self.drift_var = tk.StringVar(value="--")
+        self.cores_var = tk.StringVar(value="--")
+        self.gc_var = tk.StringVar(value="--")
+        
+        # Teach recording
+        self.recorder = TeachRecorder()
+        self.teach_tolerance_var = tk.StringVar(value=str(DEFAULT_TOLERANCE))
+        self.teach_status_var = tk.StringVar(value="Idle")
         
         # Terminal settings
         self.show_timestamps = tk.BooleanVar(value=True)
@@ -36,39 +60,22 @@ class ServoControlGUI:
         self.terminal_max_lines = 200
         self.terminal_lines = 0
         self.filter_status = tk.BooleanVar(value=True)
+        self.filter_log = tk.BooleanVar(value=False)
 
         self.create_widgets()
         self.auto_connect()
+        self.root.after(POLL_INTERVAL, self.poll_client)
+        self.root.after(int(PING_INTERVAL * 1000), self.ping_link)
     
     def auto_connect(self):
-        """Try to connect to REPL ports"""
-        ports = [
-            'COM6',  # Windows
-            '/dev/ttyACM0', '/dev/ttyACM1',   # Linux
-            '/dev/cu.usbmodem'                # macOS
-        ]
-        
-        for port in ports:
-            try:
-                self.ser = serial.Serial(port, baudrate=115200, timeout=1)
-                self.connected = True
-                self.conn_status_var.set("Connected")
-                
-                # Send a newline to wake up the REPL
-                self.ser.write(b'\r\n')
-                time.sleep(0.1)
-                
-                # Clear any initial output
-                self.ser.flushInput()
-                
-                self.start_listening()
-                self.log_message(f"Connected to REPL on {port}", "system")
-                return
-            except Exception as e:
-                self.log_message(f"Connection failed: {str(e)}", "error")
-                continue
-        
-        self.log_message("Auto-connect failed", "error")
+        """Search all ports in the background; the connection event reports the result"""
+        self.conn_status_var.set("Searching...")
+        self.log_message("Searching for Servo2040...", "system")
+        self.client.start(self.search_ports)
+    
+    @property
+    def connected(self):
+        return self.client.connected
     
     def create_widgets(self):
         # Main paned window for split view
@@ -116,6 +123,11 @@ class ServoControlGUI:
         # populate safety frame
         self.build_safety_frame(safety_frame)
 
+        # Link timing frame
+        link_frame = ttk.LabelFrame(parent, text="Link")
+        link_frame.pack(fill=tk.X, pady=(0, 10))
+        self.build_link_frame(link_frame)
+
         # Axis control frame
         axis_frame = ttk.LabelFrame(parent, text="Axis Control")
         axis_frame.pack(fill=tk.BOTH, expand=True)
@@ -126,6 +138,11 @@ class ServoControlGUI:
         playback_frame.pack(fill=tk.X, pady=(0, 10))
         self.build_playback_frame(playback_frame)
         
+        # Teach frame
+        teach_frame = ttk.LabelFrame(parent, text="Teach")
+        teach_frame.pack(fill=tk.X, pady=(0, 10))
+        self.build_teach_frame(teach_frame)
+        
         
     def build_connection_frame(self, parent):
         ttk.Label(parent, text="Port:").grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
@@ -147,6 +164,11 @@ class ServoControlGUI:
         ttk.Label(parent, text="TX:").grid(row=1, column=4, padx=(5, 0), pady=2)
         self.tx_label = ttk.Label(parent, text="0", width=5)
         self.tx_label.grid(row=1, column=5, padx=2, pady=2)
+        
+        # Axis table, applied on the device without a restart
+        ttk.Label(parent, text="Config:").grid(row=2, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Button(parent, text="Reload", command=self.reload_config).grid(row=2, column=1, padx=5, pady=2)
+        ttk.Button(parent, text="Push...", command=self.push_config).grid(row=2, column=2, padx=5, pady=2)
     
     def build_mode_frame(self, parent):
         # Current mode display
@@ -172,6 +194,14 @@ class ServoControlGUI:
         # Restart button
         ttk.Button(frame_info, text="Restart Playback", command=self.restart_playback).grid(row=0, column=2, padx=(20, 5), pady=2)
         
+        # Speed override and the rate the device actually runs at after its limits
+        ttk.Label(frame_info, text="Speed:").grid(row=1, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Spinbox(frame_info, textvariable=self.speed_var, from_=0.1, to=2.0, increment=0.1,
+                    width=6).grid(row=1, column=1, padx=5, pady=2, sticky=tk.W)
+        ttk.Button(frame_info, text="Set Speed", command=self.set_speed).grid(row=1, column=2, padx=(20, 5), pady=2)
+        ttk.Label(frame_info, text="Running at:").grid(row=1, column=3, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(frame_info, textvariable=self.rate_var, width=8).grid(row=1, column=4, padx=5, pady=2)
+        
         # System status
         status_info = ttk.Frame(parent)
         status_info.pack(fill=tk.X, padx=10, pady=5)
@@ -181,6 +211,44 @@ class ServoControlGUI:
         
         ttk.Label(status_info, text="Status:").grid(row=0, column=2, padx=(20, 5), pady=2, sticky=tk.W)
         ttk.Label(status_info, textvariable=self.overload_var, width=10).grid(row=0, column=3, padx=5, pady=2)
+        
+        # Sequences stored on the device
+        sequence_info = ttk.Frame(parent)
+        sequence_info.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(sequence_info, text="Sequence:").grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
+        self.sequence_combo = ttk.Combobox(sequence_info, textvariable=self.sequence_var, width=18, state="readonly")
+        self.sequence_combo.grid(row=0, column=1, padx=5, pady=2)
+        ttk.Button(sequence_info, text="Rescan", command=self.scan_sequences).grid(row=0, column=2, padx=5, pady=2)
+        ttk.Button(sequence_info, text="Select", command=self.select_sequence).grid(row=0, column=3, padx=5, pady=2)
+    
+    def build_teach_frame(self, parent):
+        ttk.Button(parent, text="Record", command=self.start_teach).grid(row=0, column=0, padx=5, pady=2)
+        ttk.Button(parent, text="Stop", command=self.stop_teach).grid(row=0, column=1, padx=5, pady=2)
+        ttk.Button(parent, text="Save Sequence...", command=self.save_teach).grid(row=0, column=2, padx=5, pady=2)
+        
+        ttk.Label(parent, text="Tolerance (°):").grid(row=0, column=3, padx=(20, 5), pady=2, sticky=tk.W)
+        ttk.Entry(parent, textvariable=self.teach_tolerance_var, width=6).grid(row=0, column=4, padx=5, pady=2)
+        
+        ttk.Label(parent, textvariable=self.teach_status_var, width=30).grid(row=0, column=5, padx=5, pady=2, sticky=tk.W)
+    
+    def build_link_frame(self, parent):
+        ttk.Label(parent, text="RTT p50/p95:").grid(row=0, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(parent, textvariable=self.rtt_var, width=16).grid(row=0, column=1, padx=5, pady=2, sticky=tk.W)
+        
+        ttk.Label(parent, text="Latency p50/p95:").grid(row=0, column=2, padx=(20, 5), pady=2, sticky=tk.W)
+        ttk.Label(parent, textvariable=self.latency_var, width=16).grid(row=0, column=3, padx=5, pady=2, sticky=tk.W)
+        
+        ttk.Label(parent, text="Clock drift:").grid(row=0, column=4, padx=(20, 5), pady=2, sticky=tk.W)
+        ttk.Label(parent, textvariable=self.drift_var, width=10).grid(row=0, column=5, padx=5, pady=2, sticky=tk.W)
+        
+        ttk.Label(parent, text="Core load/jitter:").grid(row=1, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(parent, textvariable=self.cores_var, width=50).grid(row=1, column=1, columnspan=5, padx=5, pady=2, sticky=tk.W)
+        
+        ttk.Label(parent, text="GC pause/heap:").grid(row=2, column=0, padx=5, pady=2, sticky=tk.W)
+        ttk.Label(parent, textvariable=self.gc_var, width=50).grid(row=2, column=1, columnspan=5, padx=5, pady=2, sticky=tk.W)
+        
+        ttk.Button(parent, text="Command Stats", command=self.command_stats).grid(row=3, column=0, padx=5, pady=2, sticky=tk.W)
     
     def build_terminal_panel(self, parent):
         # Terminal frame
@@ -200,6 +268,7 @@ class ServoControlGUI:
         self.terminal.tag_config("system", foreground="black")
         self.terminal.tag_config("error", foreground="red")
         self.terminal.tag_config("status", foreground="purple")
+        self.terminal.tag_config("log", foreground="gray")
         
         # Terminal controls frame
         ctrl_frame = ttk.Frame(terminal_frame)
@@ -210,8 +279,10 @@ class ServoControlGUI:
         ttk.Checkbutton(ctrl_frame, text="Show RX", variable=self.show_rx).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(ctrl_frame, text="Show TX", variable=self.show_tx).pack(side=tk.LEFT, padx=5)
         ttk.Checkbutton(ctrl_frame, text="Hide STATUS", variable=self.filter_status).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(ctrl_frame, text="Hide LOG", variable=self.filter_log).pack(side=tk.LEFT, padx=5)
         ttk.Button(ctrl_frame, text="Clear", command=self.clear_terminal).pack(side=tk.LEFT, padx=5)
         ttk.Button(ctrl_frame, text="Save Log", command=self.save_log).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(ctrl_frame, text="Dump Device Log", command=self.dump_device_log).pack(side=tk.RIGHT, padx=5)
 
         legend_frame = ttk.Frame(terminal_frame)
         legend_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
@@ -222,7 +293,8 @@ class ServoControlGUI:
             ("RX Data", "rx", "blue"),
             ("TX Data", "tx", "green"),
             ("Errors", "error", "red"),
-            ("STATUS", "status", "purple")
+            ("STATUS", "status", "purple"),
+            ("Device LOG", "log", "gray")
         ]
         for text, tag, color in legend_items:
             frame = ttk.Frame(legend_frame)
@@ -241,10 +313,21 @@ class ServoControlGUI:
         ttk.Label(status_info, text="Status:").grid(row=0, column=2, padx=(20, 5), pady=2, sticky=tk.W)
         ttk.Label(status_info, textvariable=self.overload_var, width=10).grid(row=0, column=3, padx=5, pady=2)
         
+        ttk.Label(status_info, text="E-STOP:").grid(row=0, column=4, padx=(20, 5), pady=2, sticky=tk.W)
+        ttk.Label(status_info, textvariable=self.estop_var, width=28).grid(row=0, column=5, padx=5, pady=2, sticky=tk.W)
+        
         # NEW: Safety buttons
         button_frame = ttk.Frame(parent)
         button_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
         
+        ttk.Button(button_frame, text="E-STOP (Esc)", 
+                  command=self.estop, 
+                  style="Emergency.TButton").pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        
+        ttk.Button(button_frame, text="RESUME", 
+                  command=self.resume).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        self.root.bind("<Escape>", lambda event: self.estop())
+        
         ttk.Button(button_frame, text="INTERRUPT", 
                   command=self.interrupt, 
                   style="Emergency.TButton").pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
@@ -256,13 +339,43 @@ class ServoControlGUI:
         style = ttk.Style()
         style.configure("Emergency.TButton", foreground="white", background="red")
     
+    def estop(self):
+        """Servos off on the device without stopping main.py"""
+        if self.connected:
+            try:
+                future = self.client.estop()
+                future.add_done_callback(lambda f: self.events.put(("estop", f)))
+                self.log_message("Sent: E-STOP", "tx")
+            except Exception as e:
+                self.log_message(f"Error sending E-STOP: {str(e)}", "error")
+    
+    def resume(self):
+        if self.connected:
+            try:
+                future = self.client.resume()
+                future.add_done_callback(lambda f: self.events.put(("estop", f)))
+                self.log_message("Sent: RESUME", "tx")
+            except Exception as e:
+                self.log_message(f"Error sending RESUME: {str(e)}", "error")
+    
+    def report_estop(self, future):
+        if future.exception() is not None:
+            self.log_message(f"E-STOP not confirmed: {future.exception()}", "error")
+            return
+        report = future.result()
+        if report.state == "stopped":
+            self.estop_var.set(f"STOPPED ({report.latency_us}us, rtt {report.round_trip * 1000:.1f}ms)")
+            self.log_message(f"E-STOP confirmed: servos off {report.latency_us}us after read, "
+                             f"{report.round_trip * 1000:.1f}ms round trip", "system")
+        else:
+            self.estop_var.set("Clear")
+            self.log_message("E-STOP released", "system")
+    
     def interrupt(self):
         if self.connected:
             try:
                 # Ctrl+C is ASCII code 3
-                self.ser.write(b'\x03')
-                self.tx_count += 1
-                self.tx_label.config(text=str(self.tx_count))
+                self.client.interrupt()
                 self.log_message("Sent: INTERRUPT (Ctrl+C)", "tx")
             except Exception as e:
                 self.log_message(f"Error sending interrupt: {str(e)}", "error")
@@ -271,9 +384,7 @@ class ServoControlGUI:
         if self.connected:
             try:
                 # Ctrl+D is ASCII code 4
-                self.ser.write(b'\x04')
-                self.tx_count += 1
-                self.tx_label.config(text=str(self.tx_count))
+                self.client.soft_reset()
                 self.log_message("Sent: SOFT RESET (Ctrl+D)", "tx")
             except Exception as e:
                 self.log_message(f"Error sending soft reset: {str(e)}", "error")
@@ -287,23 +398,29 @@ class ServoControlGUI:
             # Axis name and position
             name_var = tk.StringVar(value=f"Axis {i+1}")
             pos_var = tk.StringVar(value="0.00°")
+            measured_var = tk.StringVar(value="--")
             
             ttk.Label(frame, textvariable=name_var, width=8).grid(row=0, column=0, padx=5, sticky=tk.W)
             
             ttk.Label(frame, text="Position:").grid(row=0, column=1, padx=5)
             ttk.Label(frame, textvariable=pos_var, width=8).grid(row=0, column=2, padx=5)
             
+            # Sensor feedback next to the commanded position
+            ttk.Label(frame, text="Measured:").grid(row=0, column=3, padx=5)
+            ttk.Label(frame, textvariable=measured_var, width=8).grid(row=0, column=4, padx=5)
+            
             # Progress bar showing position in range
             progress = ttk.Progressbar(frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
-            progress.grid(row=0, column=3, padx=10)
+            progress.grid(row=0, column=5, padx=10)
             
             # Home button
-            ttk.Button(frame, text="Home", width=8, command=lambda idx=i: self.home_axis(idx)).grid(row=0, column=4, padx=5)
+            ttk.Button(frame, text="Home", width=8, command=lambda idx=i: self.home_axis(idx)).grid(row=0, column=6, padx=5)
             
             # Store references
             self.axes.append({
                 "name": name_var,
                 "position": pos_var,
+                "measured": measured_var,
                 "progress": progress,
                 "min": -90,
                 "max": 90
@@ -319,7 +436,10 @@ class ServoControlGUI:
             return
         if msg_type == "tx" and not self.show_tx.get():
             return
-        if msg_type == "rx" and self.filter_status.get() and "STATUS:" in message:
+        if msg_type == "rx" and self.filter_status.get() and message.startswith(("STATUS:", "PONG:")):
+            return
+        is_device_log = msg_type == "rx" and message.startswith(("LOG:", "LOG_DUMP:"))
+        if is_device_log and self.filter_log.get() and not message.startswith("LOG_DUMP:"):
             return
             
         # Get timestamp
@@ -341,6 +461,8 @@ class ServoControlGUI:
         
         if "STATUS:" in message and msg_type == "rx":
             self.terminal.insert(tk.END, formatted_msg, "status")
+        elif is_device_log:
+            self.terminal.insert(tk.END, formatted_msg, "log")
         else:
             self.terminal.insert(tk.END, formatted_msg, msg_type)
         self.terminal.see(tk.END)
@@ -366,16 +488,20 @@ class ServoControlGUI:
         for i, axis in enumerate(axis_data):
             if i < len(self.axes):
                 # Update name if needed
-                if axis["name"] != self.axes[i]["name"].get():
-                    self.axes[i]["name"].set(axis["name"])
+                if axis.name != self.axes[i]["name"].get():
+                    self.axes[i]["name"].set(axis.name)
                 
                 # Update position
-                pos = axis["position"]
+                pos = axis.position
                 self.axes[i]["position"].set(f"{pos:.1f}°")
                 
+                # Update sensor feedback (None until the scanner has sampled it)
+                measured = axis.measured
+                self.axes[i]["measured"].set("--" if measured is None else f"{measured:.1f}°")
+                
                 # Update progress bar
-                min_val = axis["min"]
-                max_val = axis["max"]
+                min_val = axis.min
+                max_val = axis.max
                 range_val = max_val - min_val
                 if range_val > 0:
                     progress = ((pos - min_val) / range_val) * 100
@@ -385,77 +511,123 @@ class ServoControlGUI:
                 self.axes[i]["min"] = min_val
                 self.axes[i]["max"] = max_val
     
+    def poll_client(self):
+        """Apply events queued by the client's reader thread; reschedules itself"""
+        for _ in range(POLL_BATCH):
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "line":
+                self.log_message(event[1], "rx")
+            elif event[0] == "status":
+                self.process_status(event[1])
+            elif event[0] == "connection":
+                self.update_connection(event[1], event[2])
+            elif event[0] == "estop":
+                self.report_estop(event[1])
+            elif event[0] == "cmd_stats":
+                self.report_command_stats(event[1])
+            elif event[0] == "config":
+                self.report_config(event[1])
+            elif event[0] == "sequences":
+                self.show_sequences(event[1])
+        
+        self.rx_label.config(text=str(self.client.rx_count))
+        self.tx_label.config(text=str(self.client.tx_count))
+        self.root.after(POLL_INTERVAL, self.poll_client)
+    
+    def update_connection(self, connected, port):
+        if connected:
+            self.conn_status_var.set("Connected")
+            self.port_var.set(port)
+            downtime = self.client.last_downtime
+            if downtime is not None:
+                self.log_message(f"Reconnected to {port} after {downtime:.2f}s", "system")
+            else:
+                self.log_message(f"Connected to {port}", "system")
+            self.list_sequences()
+        elif self.client.supervising:
+            self.conn_status_var.set("Reconnecting...")
+            self.log_message(f"Connection to {port} lost, reconnecting", "error")
+        else:
+            self.conn_status_var.set("Disconnected")
+            self.log_message(f"Connection to {port} closed", "system")
+    
+    def ping_link(self):
+        """Send a PING and refresh the link readout; reschedules itself"""
+        if self.connected:
+            try:
+                self.client.ping()
+            except Exception as e:
+                self.log_message(f"Ping error: {str(e)}", "error")
+        
+        clock = self.client.clock
+        stats = clock.stats()
+        if stats["rtt_p50"] is not None:
+            self.rtt_var.set(f"{stats['rtt_p50']:.1f}/{stats['rtt_p95']:.1f} ms")
+        if stats["latency_p50"] is not None:
+            self.latency_var.set(f"{stats['latency_p50']:.1f}/{stats['latency_p95']:.1f} ms")
+        if clock.synced():
+            self.drift_var.set(f"{stats['drift_ppm']:.0f} ppm")
+        self.root.after(int(PING_INTERVAL * 1000), self.ping_link)
+    
     def process_status(self, status):
         try:
-            # Handle both string and dictionary status
-            if isinstance(status, str):
-                if status.startswith("STATUS:"):
-                    try:
-                        status = json.loads(status[7:])
-                    except:
-                        self.log_message("Invalid JSON status", "error")
-                        return
-                else:
-                    return  # Not a status message
-            
-            # Now process as dictionary
-            self.mode_var.set(status.get("mode", "Unknown"))
-            self.current_var.set(f"{status.get('current', 0):.2f}A")
+            self.mode_var.set(status.mode)
+            self.current_var.set(f"{status.current:.2f}A")
             
             # Handle frame information
-            if "frame" in status and "total_frames" in status:
-                self.frame_var.set(f"{status['frame']}/{status['total_frames']}")
+            if status.frame is not None and status.total_frames is not None:
+                self.frame_var.set(f"{status.frame}/{status.total_frames}")
             else:
                 self.frame_var.set("N/A")
+            self.rate_var.set(f"{status.rate:.2f}x" if status.rate is not None else "--")
             
             # Handle overload status
-            if "overloaded" in status:
-                self.overload_var.set("Overload!" if status["overloaded"] else "Normal")
-            else:
-                self.overload_var.set("Unknown")
+            self.overload_var.set("Overload!" if status.overloaded else "Normal")
+            if status.estop and not self.estop_var.get().startswith("STOPPED"):
+                # Latched from elsewhere (another client, or before we connected)
+                self.estop_var.set("STOPPED")
+            elif not status.estop and self.estop_var.get() != "Clear":
+                self.estop_var.set("Clear")
             
             # Update axes information
-            if "axes" in status:
-                self.update_axis(status["axes"])
+            if status.axes:
+                self.update_axis(status.axes)
+                
+                # Teach recording uses the device timestamp so link jitter doesn't distort timing
+                if self.recorder.recording:
+                    t = self.client.clock.device_seconds(status.t) if status.t is not None else status.received
+                    self.recorder.add(t, [axis.position for axis in status.axes])
+                    self.teach_status_var.set(f"Recording: {len(self.recorder)} samples")
+            
+            # Per-core busy share and loop jitter
+            if status.cores:
+                self.cores_var.set("   ".join(
+                    f"core{index}: {core['busy']:.0f}% / {core['jitter_us'] / 1000:.1f}ms"
+                    for index, core in enumerate(status.cores)))
+            
+            if status.gc:
+                gc = status.gc
+                self.gc_var.set(f"{gc['collections']} runs ({gc.get('window_collections', 0)} now), max {gc['pause_max_us'] / 1000:.1f}ms, "
+                                f"free {gc['free'] // 1024}k (min {gc['free_min'] // 1024}k, "
+                                f"live {gc['free_after'] // 1024}k)")
+            
+            # Startup profile, sent once on the first STATUS after boot
+            if status.boot:
+                boot = status.boot
+                phases = ", ".join(f"{name}={ms:.1f}" for name, ms in boot.items() if name != "total")
+                self.log_message(f"Boot took {boot.get('total', 0):.1f}ms ({phases})", "system")
         except Exception as e:
             self.log_message(f"Error processing status: {str(e)}", "error")
     
-    def start_listening(self):
-        def serial_listener():
-            while self.connected:
-                try:
-                    if self.ser.in_waiting:
-                        line = self.ser.readline().decode('utf-8', errors='ignore').strip()
-                        if line:
-                            self.rx_count += 1
-                            self.rx_label.config(text=str(self.rx_count))
-                            
-                            # Log to terminal
-                            self.log_message(line, "rx")
-                            
-                            # Process STATUS messages
-                            if line.startswith("STATUS:"):
-                                json_str = line[7:]
-                                try:
-                                    status = json.loads(json_str)
-                                    self.root.after(0, lambda s=status: self.process_status(s))
-                                except json.JSONDecodeError:
-                                    self.log_message(f"Invalid JSON: {json_str}", "error")
-                except Exception as e:
-                    self.connected = False
-                    self.conn_status_var.set("Disconnected")
-                    self.log_message(f"Connection lost: {str(e)}", "error")
-                    break
-        
-        threading.Thread(target=serial_listener, daemon=True).start()
-    
-    def send_command(self, command):
+    def send_command(self, command, quiet=False):
         if self.connected:
             try:
-                self.ser.write((command + "\n").encode('utf-8'))
-                self.tx_count += 1
-                self.tx_label.config(text=str(self.tx_count))
-                self.log_message(command, "tx")
+                self.client.send(command)
+                if not quiet:
+                    self.log_message(command, "tx")
             except Exception as e:
                 self.log_message(f"Send error: {str(e)}", "error")
     
@@ -466,21 +638,15 @@ class ServoControlGUI:
             return
         
         try:
-            self.ser = serial.Serial(port, self.baudrate, timeout=1)
-            self.connected = True
-            self.conn_status_var.set("Connected")
-            self.start_listening()
-            self.log_message(f"Connected to {port}", "system")
+            self.client.connect(port)
+            self.client.start(self.search_ports)
         except serial.SerialException as e:
             self.log_message(f"Connection failed: {str(e)}", "error")
     
     def disconnect(self):
         if self.connected:
             try:
-                self.ser.close()
-                self.connected = False
-                self.conn_status_var.set("Disconnected")
-                self.log_message("Disconnected", "system")
+                self.client.disconnect()
             except Exception as e:
                 self.log_message(f"Disconnect error: {str(e)}", "error")
     
@@ -496,9 +662,143 @@ class ServoControlGUI:
         self.log_message(f"Sending: SET_MODE:{mode_index}", "tx")
         self.send_command(f"SET_MODE:{mode_index}")
     
+    def dump_device_log(self):
+        self.log_message("Sending: LOG_DUMP", "tx")
+        self.send_command("LOG_DUMP")
+    
+    def start_teach(self):
+        self.recorder.start()
+        self.teach_status_var.set("Recording...")
+        self.log_message("Teach recording started", "system")
+    
+    def stop_teach(self):
+        self.recorder.stop()
+        self.teach_status_var.set(f"Stopped: {len(self.recorder)} samples")
+        self.log_message(f"Teach recording stopped with {len(self.recorder)} samples", "system")
+    
+    def save_teach(self):
+        """Reduce the recording to keyframes and write it as a sequence file"""
+        self.recorder.stop()
+        if len(self.recorder) < 2:
+            self.log_message("Nothing recorded to save", "error")
+            return
+        try:
+            tolerance = float(self.teach_tolerance_var.get())
+        except ValueError:
+            self.log_message("Invalid tolerance", "error")
+            return
+        
+        filename = filedialog.asksaveasfilename(initialfile="sequence.csv", defaultextension=".csv",
+                                                filetypes=[("Sequence", "*.csv")])
+        if not filename:
+            return
+        
+        times, positions = self.recorder.trajectory()
+        keyframes = reduce_keyframes(times, positions, tolerance)
+        error = max_replay_error(times, positions, keyframes)
+        try:
+            save_sequence(filename, positions[keyframes], times[keyframes])
+        except OSError as e:
+            self.log_message(f"Error saving sequence: {str(e)}", "error")
+            return
+        ratio = len(times) / len(keyframes)
+        self.teach_status_var.set(f"{len(times)} -> {len(keyframes)} frames ({ratio:.0f}x)")
+        self.log_message(f"Saved {len(keyframes)} keyframes from {len(times)} samples to {filename} "
+                         f"(max error {error:.2f}°)", "system")
+    
     def restart_playback(self):
         self.log_message("Sending: RESTART_PLAYBACK", "tx")
         self.send_command("RESTART_PLAYBACK")
+    
+    def command_stats(self):
+        if self.connected:
+            try:
+                future = self.client.command_stats()
+                future.add_done_callback(lambda f: self.events.put(("cmd_stats", f)))
+                self.log_message("Sent: CMD_STATS", "tx")
+            except Exception as e:
+                self.log_message(f"Error requesting command stats: {str(e)}", "error")
+    
+    def report_command_stats(self, future):
+        if future.exception() is not None:
+            self.log_message(f"Command stats failed: {future.exception()}", "error")
+            return
+        report = future.result()
+        for name, stats in sorted(report["commands"].items()):
+            self.log_message(f"{name}: {stats['count']} calls, {stats['min_us']}/{stats['mean_us']}/"
+                             f"{stats['max_us']}us min/mean/max", "system")
+        self.log_message(f"Unknown commands: {report['unknown']}", "system")
+    
+    def reload_config(self):
+        if self.connected:
+            try:
+                future = self.client.reload_config()
+                future.add_done_callback(lambda f: self.events.put(("config", f)))
+                self.log_message("Sent: RELOAD_CONFIG", "tx")
+            except Exception as e:
+                self.log_message(f"Error reloading config: {str(e)}", "error")
+    
+    def push_config(self):
+        if not self.connected:
+            return
+        filename = filedialog.askopenfilename(initialfile="config.json", filetypes=[("Config", "*.json")])
+        if not filename:
+            return
+        try:
+            with open(filename) as f:
+                config = json.load(f)
+            future = self.client.push_config(config)
+            future.add_done_callback(lambda f: self.events.put(("config", f)))
+            self.log_message(f"Sent: CONFIG_PUSH ({filename})", "tx")
+        except Exception as e:
+            self.log_message(f"Error pushing config: {str(e)}", "error")
+    
+    def report_config(self, future):
+        if future.exception() is not None:
+            self.log_message(f"Config not applied: {future.exception()}", "error")
+            return
+        report = future.result()
+        changes = ", ".join(f"{count} {name}" for name, count in report["changes"].items() if count) or "no changes"
+        self.log_message(f"Config applied in {report['reload_us']}us: {changes}", "system")
+    
+    def set_speed(self):
+        try:
+            speed = float(self.speed_var.get())
+        except ValueError:
+            self.log_message("Invalid speed", "error")
+            return
+        self.log_message(f"Sending: SPEED:{speed:g}", "tx")
+        self.send_command(f"SPEED:{speed:g}")
+    
+    def list_sequences(self, scan=False):
+        if self.connected:
+            try:
+                future = self.client.scan_sequences() if scan else self.client.list_sequences()
+                future.add_done_callback(lambda f: self.events.put(("sequences", f)))
+                self.log_message("Sent: " + ("SCAN_SEQUENCES" if scan else "LIST_SEQUENCES"), "tx")
+            except Exception as e:
+                self.log_message(f"Error listing sequences: {str(e)}", "error")
+    
+    def scan_sequences(self):
+        self.list_sequences(scan=True)
+    
+    def show_sequences(self, future):
+        if future.exception() is not None:
+            self.log_message(f"Sequence list failed: {future.exception()}", "error")
+            return
+        listing = future.result()
+        names = [entry["name"] for entry in listing.get("sequences", [])]
+        self.sequence_combo["values"] = names
+        self.sequence_var.set(listing.get("selected") or "")
+        scan_us = listing.get("scan_us")
+        scanned = f" (scan took {scan_us / 1000:.1f}ms)" if scan_us is not None else ""
+        self.log_message(f"{len(names)} sequences on device{scanned}", "system")
+    
+    def select_sequence(self):
+        name = self.sequence_var.get()
+        if name:
+            self.log_message(f"Sending: SELECT_SEQUENCE:{name}", "tx")
+            self.send_command(f"SELECT_SEQUENCE:{name}")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -4,6 +4,7 @@ from servo import Servo, Calibration, servo2040
 import time
 import sys
 import io
+import json
 import uselect
 
 class Hardware:
@@ -24,16 +25,46 @@ class Hardware:
                 self.stdout = sys.stdout
                 self.poll = uselect.poll()
                 self.poll.register(sys.stdin, uselect.POLLIN)
+                # Set in dual-core mode so lines from both cores don't interleave
+                self.lock = None
                 
             def any(self):
-                return self.poll.poll(0)  # Always assume data might be available
+                # ipoll reuses its result, so polling every byte allocates nothing
+                for _ in self.poll.ipoll(0):
+                    return True
+                return False
                 
             def read(self, size=1):
                 return self.stdin.read(size) if self.any() else b''
                 
+            def wait(self, timeout):
+                """Block up to timeout ms for input; True as soon as there is some"""
+                for _ in self.poll.ipoll(timeout):
+                    return True
+                return False
+                
+            def readinto(self, buf):
+                """Fill a preallocated buffer from stdin; call only after any()"""
+                return self.stdin.buffer.readinto(buf)
+                
             def write(self, data):
+                if self.lock:
+                    with self.lock:
+                        return self.stdout.write(data)
                 return self.stdout.write(data)
                 
+            def write_json(self, prefix, obj):
+                """Write prefix, obj as JSON and a newline without building the line in RAM"""
+                if self.lock:
+                    with self.lock:
+                        return self.write_json_line(prefix, obj)
+                return self.write_json_line(prefix, obj)
+                
+            def write_json_line(self, prefix, obj):
+                self.stdout.write(prefix)
+                json.dump(obj, self.stdout)
+                self.stdout.write("\n")
+                
         self.uart = REPL_IO()
         self.debug_log("REPL communication initialized")
         
@@ -50,12 +81,19 @@ class Hardware:
         self.mux = AnalogMux(servo2040.ADC_ADDR_0, servo2040.ADC_ADDR_1, servo2040.ADC_ADDR_2,
                              muxed_pin=Pin(servo2040.SHARED_ADC))
         self.user_sw = Button(servo2040.USER_SW)
+        # Set in dual-core mode, where core 1 scans the mux
+        self.adc_lock = None
         self.debug_log("Analog components initialized")
         
     def initialize_servo_components(self):
         self.debug_log("Initializing servo components...")
         # Servo objects will be created in config manager
         self.axes = []
+        # Attached by main.py once the axes exist
+        self.scheduler = None
+        self.scanner = None
+        self.estop = None
+        self.playback_limiter = None
         self.debug_log("Servo components ready")
         
     def enable_servos(self):
@@ -71,14 +109,30 @@ class Hardware:
         self.debug_log("All servos disabled")
         
     def home_all_axes(self):
+        if self.scheduler:
+            # Staggered by the scheduler to keep the combined draw in budget
+            self.debug_log("Homing all axes (scheduled)...")
+            self.scheduler.move_all([axis["home"] for axis in self.axes])
+            return
         self.debug_log("Homing all axes...")
         for axis in self.axes:
-            self.debug_log(f"  Homing {axis['name']} to {axis['home']}°")
+            self.debug_log("  Homing %s to %s°", axis['name'], axis['home'])
             axis["servo"].value(axis["home"])
         time.sleep(1)
         self.debug_log("Homing complete")
         
     def home_single_axis(self, index):
         axis = self.axes[index]
-        self.debug_log(f"Homing axis {index} ({axis['name']}) to {axis['home']}°")
-        axis["servo"].value(axis["home"])
\ No newline at end of file
+        self.debug_log("Homing axis %d (%s) to %s°", index, axis['name'], axis['home'])
+        if self.scheduler:
+            self.scheduler.move_axis(index, axis["home"])
+        else:
+            axis["servo"].value(axis["home"])
+
+    def move_axes(self, values):
+        """Command one value per axis, e.g. a playback frame"""
+        if self.scheduler:
+            self.scheduler.move_all(values)
+        else:
+            for axis, value in zip(self.axes, values):
+                axis["servo"].value(value)
\ No newline at end of file
@@ -0,0 +1,218 @@
+"""Load test: run the virtual Servo2040 at several STATUS rates and measure what the host keeps up with.
+
+    python load_test.py --rates 10 100 500 1000 --duration 5
+    python load_test.py --gui --garbage 0.01     # also time the GUI's event queue (needs a display)
+
+For each rate it reports STATUS lines sent and received, drops, the
+emulator-to-client latency, command round trips under that load, and with
+--gui the latency until the Tk thread has applied each STATUS.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from clock_sync import percentile
+from device_emulator import VirtualServo2040, load_axes
+from servo_client import ServoClient
+
+RATES = [10, 50, 100, 250, 500, 1000]
+CONNECT_TIMEOUT = 5.0   # s for the client to find the emulator
+DRAIN_TIME = 0.3        # s to let in-flight lines arrive after the window closes
+PING_PERIOD = 0.1       # s between round-trip probes during a run
+
+
+class Run:
+    """Counters and samples for one rate"""
+
+    def __init__(self, rate, device):
+        self.rate = rate
+        self.device = device
+        self.start = None
+        self.end = None
+        self.sent_before = 0
+        self.sent = 0
+        self.received = 0
+        self.latencies = []
+        self.gui_latencies = []
+        self.rtts = []
+
+    def in_window(self, status):
+        """Send time of a STATUS if it went out during the measurement window"""
+        sent = self.device.sent_times.get(status.raw.get("seq"))
+        if sent is None or self.start is None or sent < self.start:
+            return None
+        if self.end is not None and sent > self.end:
+            return None
+        return sent
+
+    def on_status(self, status):
+        sent = self.in_window(status)
+        if sent is not None:
+            self.received += 1
+            self.latencies.append(status.received - sent)
+
+    def begin(self):
+        self.sent_before = self.device.status_sent
+        self.start = time.monotonic()
+
+    def finish(self):
+        self.end = time.monotonic()
+        self.sent = self.device.status_sent - self.sent_before
+
+    def summary(self):
+        elapsed = (self.end - self.start) if self.end else 0
+        result = {
+            "rate": self.rate,
+            "achieved_hz": round(self.sent / elapsed, 1) if elapsed else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": max(0, self.sent - self.received),
+            "drop_pct": round(100 * max(0, self.sent - self.received) / self.sent, 2) if self.sent else 0,
+            "blocked": self.device.status_blocked,
+            "garbage": self.device.garbage_sent,
+            "disconnects": self.device.disconnects,
+        }
+        for name, samples in (("latency", self.latencies), ("gui", self.gui_latencies), ("rtt", self.rtts)):
+            if samples:
+                result[f"{name}_p50_ms"] = round(percentile(samples, 0.5) * 1000, 2)
+                result[f"{name}_p95_ms"] = round(percentile(samples, 0.95) * 1000, 2)
+                result[f"{name}_max_ms"] = round(max(samples) * 1000, 2)
+        return result
+
+
+def record_rtt(run, future):
+    if future.exception() is None:
+        run.rtts.append(future.result())
+
+
+def wait_connected(client, timeout=CONNECT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not client.connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return client.connected
+
+
+def run_headless(run, link, args):
+    client = ServoClient()
+    client.on_status(run.on_status)
+    client.start([link])
+    try:
+        if not wait_connected(client):
+            raise RuntimeError(f"Client never connected to {link}")
+        run.begin()
+        deadline = run.start + args.duration
+        while time.monotonic() < deadline:
+            if client.connected:
+                client.ping().add_done_callback(lambda f: record_rtt(run, f))
+            time.sleep(PING_PERIOD)
+        run.finish()
+        time.sleep(DRAIN_TIME)
+    finally:
+        client.disconnect()
+
+
+def run_gui(run, link, args):
+    import tkinter as tk
+    from gui import ServoControlGUI
+
+    class TimedGUI(ServoControlGUI):
+        """The real GUI, timing how long each STATUS took to reach the Tk thread"""
+
+        def process_status(self, status):
+            sent = run.in_window(status)
+            if sent is not None:
+                run.gui_latencies.append(time.monotonic() - sent)
+            super().process_status(status)
+
+    root = tk.Tk()
+    app = TimedGUI(root, ports=[link])
+    app.client.on_status(run.on_status)
+    state = {"phase": "connect", "until": time.monotonic() + CONNECT_TIMEOUT}
+
+    def tick():
+        now = time.monotonic()
+        if state["phase"] == "connect":
+            if app.client.connected:
+                run.begin()
+                state.update(phase="measure", until=now + args.duration)
+            elif now > state["until"]:
+                state["phase"] = "failed"
+                root.quit()
+                return
+        elif state["phase"] == "measure":
+            if app.client.connected:
+                app.client.ping().add_done_callback(lambda f: record_rtt(run, f))
+            if now > state["until"]:
+                run.finish()
+                state.update(phase="drain", until=now + DRAIN_TIME)
+        elif now > state["until"]:
+            root.quit()
+            return
+        root.after(int(PING_PERIOD * 1000), tick)
+
+    root.after(0, tick)
+    try:
+        root.mainloop()
+    finally:
+        app.client.disconnect()
+        root.destroy()
+    if state["phase"] == "failed":
+        raise RuntimeError(f"GUI never connected to {link}")
+
+
+def measure(rate, args):
+    link = os.path.join(tempfile.gettempdir(), f"servo2040-load-{os.getpid()}")
+    device = VirtualServo2040(load_axes(args.config), rate, args.noise, args.garbage,
+                              args.disconnect_every, args.downtime, link)
+    device.start()
+    run = Run(rate, device)
+    try:
+        if args.gui:
+            run_gui(run, link, args)
+        else:
+            run_headless(run, link, args)
+    finally:
+        device.stop()
+    return run.summary()
+
+
+def print_table(results):
+    columns = [("rate", "rate"), ("achieved_hz", "Hz"), ("sent", "sent"), ("received", "recv"),
+               ("drop_pct", "drop%"), ("latency_p50_ms", "lat50"), ("latency_p95_ms", "lat95"),
+               ("latency_max_ms", "latmax"), ("gui_p50_ms", "gui50"), ("gui_p95_ms", "gui95"),
+               ("gui_max_ms", "guimax"), ("rtt_p50_ms", "rtt50"), ("rtt_p95_ms", "rtt95"),
+               ("garbage", "junk"), ("disconnects", "drops")]
+    print(" ".join(f"{title:>7}" for _, title in columns))
+    for result in results:
+        print(" ".join(f"{str(result.get(key, '-')):>7}" for key, _ in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure host latency and drops against the virtual Servo2040")
+    parser.add_argument("--rates", type=float, nargs="+", default=RATES, help="STATUS rates (Hz) to test")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds measured per rate")
+    parser.add_argument("--config", default="config.json", help="axis table to emulate")
+    parser.add_argument("--noise", type=float, default=0.0, help="emulator sensor noise (degrees)")
+    parser.add_argument("--garbage", type=float, default=0.0, help="chance per STATUS of a corrupt line")
+    parser.add_argument("--disconnect-every", type=float, help="drop the port every N seconds")
+    parser.add_argument("--downtime", type=float, default=1.0, help="seconds the port stays gone")
+    parser.add_argument("--gui", action="store_true", help="drive the Tk GUI instead of a bare client")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    results = []
+    for rate in args.rates:
+        result = measure(rate, args)
+        results.append(result)
+        if args.json:
+            print(json.dumps(result), flush=True)
+    if not args.json:
+        print_table(results)
+    return 0 if all(result["received"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import time
+import os
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+OFF = 100
+
+LEVEL_TAGS = {DEBUG: "D", INFO: "I", WARN: "W", ERROR: "E"}
+LEVEL_NAMES = {"DEBUG": DEBUG, "INFO": INFO, "WARN": WARN, "ERROR": ERROR, "OFF": OFF}
+
+# Every console log line starts with this so the host can tell it from STATUS telemetry
+LOG_PREFIX = "LOG:"
+DUMP_PREFIX = "LOG_DUMP:"
+
+RING_SIZE = 64
+
+# Flash event log: appended in page-sized batches, rotated between two files
+FLASH_LOG = "events.log"
+FLASH_LOG_OLD = "events.1.log"
+FLASH_LOG_MAX = 16 * 1024   # bytes per file
+FLASH_FLUSH_BYTES = 512     # batch size, so small events don't each rewrite a block
+FLASH_MIN_INTERVAL = 5000   # ms between automatic flushes, so error storms can't wear the flash
+FLASH_PENDING_MAX = 4096    # bytes held in RAM before new events are dropped
+
+
+class Logger:
+    """Leveled logger with a RAM ring of recent events and a rotating flash log"""
+
+    def __init__(self, level=INFO, flash_level=WARN, ring_size=RING_SIZE):
+        self.ring = [None] * ring_size
+        self.ring_index = 0
+        self.pending = []
+        self.pending_bytes = 0
+        self.dropped = 0
+        self.last_flush = time.ticks_ms()
+        # Shared with the console writer when both cores print
+        self.write_lock = None
+        # Set in dual-core mode: both cores log, and the ring, the pending
+        # batch and the flash file must only change from one at a time
+        self.lock = None
+        try:
+            self.flash_size = os.stat(FLASH_LOG)[6]
+        except OSError:
+            self.flash_size = 0
+        self.set_level(level, flash_level)
+
+    def set_level(self, level, flash_level=None):
+        self.level = level
+        if flash_level is not None:
+            self.flash_level = flash_level
+        # One compare on the hot path decides whether anything is formatted at all
+        self.min_level = min(self.level, self.flash_level)
+
+    def debug(self, message, *args):
+        if self.min_level > DEBUG:
+            return
+        self.log(DEBUG, message, args)
+
+    def info(self, message, *args):
+        if self.min_level > INFO:
+            return
+        self.log(INFO, message, args)
+
+    def warn(self, message, *args):
+        if self.min_level > WARN:
+            return
+        self.log(WARN, message, args)
+
+    def error(self, message, *args):
+        if self.min_level > ERROR:
+            return
+        self.log(ERROR, message, args)
+
+    def log(self, level, message, args=()):
+        if level < self.min_level:
+            return
+        if args:
+            message = message % args
+        line = f"{time.ticks_ms()} {LEVEL_TAGS[level]} {message}"
+        if self.lock:
+            with self.lock:
+                self.record(level, line)
+        else:
+            self.record(level, line)
+
+    def record(self, level, line):
+        self.ring[self.ring_index] = line
+        self.ring_index = (self.ring_index + 1) % len(self.ring)
+
+        if level >= self.level:
+            if self.write_lock:
+                with self.write_lock:
+                    self.emit(line)
+            else:
+                self.emit(line)
+
+        if level >= self.flash_level:
+            if self.pending_bytes >= FLASH_PENDING_MAX:
+                self.dropped += 1
+                return
+            self.pending.append(line)
+            self.pending_bytes += len(line) + 1
+            if (level >= ERROR or self.pending_bytes >= FLASH_FLUSH_BYTES) and \
+                    time.ticks_diff(time.ticks_ms(), self.last_flush) >= FLASH_MIN_INTERVAL:
+                self.write_pending()
+
+    def poll(self):
+        """Once per main-loop pass: flush events held back by FLASH_MIN_INTERVAL
+
+        Without it, events logged inside the interval reach flash only when
+        a later event arrives, so a reset would lose the last ones.
+        """
+        if (self.pending or self.dropped) and \
+                time.ticks_diff(time.ticks_ms(), self.last_flush) >= FLASH_MIN_INTERVAL:
+            self.flush()
+
+    def emit(self, line):
+        try:
+            print(LOG_PREFIX + line)
+        except:
+            pass
+
+    def flush(self):
+        """Append pending events to flash, rotating once the file is full"""
+        if self.lock:
+            with self.lock:
+                self.write_pending()
+        else:
+            self.write_pending()
+
+    def write_pending(self):
+        self.last_flush = time.ticks_ms()
+        if self.dropped:
+            line = f"{self.last_flush} W {self.dropped} events dropped"
+            self.pending.append(line)
+            self.pending_bytes += len(line) + 1
+            self.dropped = 0
+        if not self.pending:
+            return
+        try:
+            if self.flash_size + self.pending_bytes > FLASH_LOG_MAX:
+                try:
+                    os.remove(FLASH_LOG_OLD)
+                except OSError:
+                    pass
+                os.rename(FLASH_LOG, FLASH_LOG_OLD)
+                self.flash_size = 0
+            with open(FLASH_LOG, "a") as f:
+                for line in self.pending:
+                    f.write(line)
+                    f.write("\n")
+            self.flash_size += self.pending_bytes
+        except OSError as e:
+            print(f"{LOG_PREFIX}0 E Event log write failed: {str(e)}")
+        self.pending = []
+        self.pending_bytes = 0
+
+    def dump(self, write):
+        """Write the flash log and then the RAM ring, one tagged line each"""
+        if self.lock:
+            with self.lock:
+                self.write_dump(write)
+        else:
+            self.write_dump(write)
+
+    def write_dump(self, write):
+        self.write_pending()
+        write(DUMP_PREFIX + "BEGIN\n")
+        for filename in (FLASH_LOG_OLD, FLASH_LOG):
+            try:
+                with open(filename, "r") as f:
+                    for line in f:
+                        write(DUMP_PREFIX + "F " + line.rstrip("\n") + "\n")
+            except OSError:
+                pass
+        size = len(self.ring)
+        for i in range(size):
+            line = self.ring[(self.ring_index + i) % size]
+            if line is not None:
+                write(DUMP_PREFIX + "R " + line + "\n")
+        write(DUMP_PREFIX + "END\n")
@@ -1,15 +1,24 @@
 import time
+boot_start = time.ticks_us()
 import sys
 import gc
 import os
 from hardware import Hardware
 from config_manager import ConfigManager
-from communication import Communication
-from utilities import debug_log, read_current, handle_overload
-from modes.base_mode import BaseMode
-from modes.home_mode import HomeMode
-from modes.jog_mode import JogMode
-from modes.playback_mode import PlaybackMode
+from communication import Communication, EVENT_MODE, EVENT_RESTART
+from motion_scheduler import MotionScheduler
+from playback_limiter import PlaybackLimiter
+from playback_clock import PlaybackClock
+from sensor_scanner import SensorScanner
+from sequence import Sequence
+from sequence_library import SequenceLibrary
+from estop import EmergencyStop
+from logger import INFO
+from utilities import debug_log, log, handle_overload, StartupProfile, LoopStats, GcMonitor
+
+# Time every init phase; reported once on the first STATUS
+boot_profile = StartupProfile(boot_start)
+boot_profile.mark("imports")
 
 # Enable garbage collection
 gc.enable()
@@ -28,9 +37,13 @@ print("Catacomb Navigation Unit - Clayton W")
 
 # Constants
 MAX_CURRENT = 2.0
+MOTION_CURRENT_BUDGET = 1.6  # A, predicted draw the scheduler plans moves within
 CURRENT_CHECK_INTERVAL = 250  # ms
 STATUS_INTERVAL = 100  # ms
 FRAME_RATE = 30
+LOG_LEVEL = INFO  # console; DEBUG lines are dropped before any formatting
+DUAL_CORE = False  # comms, sampling and STATUS encoding on core 1; motion stays here
+LOOP_PERIOD_US = 10000  # fixed core 0 period in dual-core mode
 
 # Track if we've already run to prevent double execution
 #if '_main_executed' in globals():
@@ -38,54 +51,110 @@ FRAME_RATE = 30
 #    sys.exit()
 #_main_executed = True
 
-# Debug function that works before hardware is initialized
-def initial_debug(message):
-    print(message)  # Fallback to print until UART is ready
-
 # Initialize system
-initial_debug("Starting system initialization...")
+log.set_level(LOG_LEVEL)
+log.info("Starting system initialization...")
 
 # Setup hardware
 try:
-    hardware = Hardware(initial_debug)
+    hardware = Hardware(debug_log)
 except Exception as e:
     print(f"Hardware init failed: {str(e)}")
     sys.exit()
+boot_profile.mark("hardware")
 
 # Setup config manager
 try:
     #print("Calling config manager from main.py")
-    config_manager = ConfigManager(hardware, lambda msg: debug_log(msg))
+    config_manager = ConfigManager(hardware, debug_log)
     #print("Calling config data from main.py")
     config_data = config_manager.load_config()
     #print("Calling create axes from main.py")
     config_manager.create_axes(config_data)
     #print("sequence data from main.py")
-    sequence_data = config_manager.load_sequence()
+    # Sequence library: CSVs are converted once, the selected one is read on first playback
+    library = SequenceLibrary(hardware, debug_log,
+                              lambda filename: config_manager.load_sequence(filename, FRAME_RATE))
+    library.scan()
+    sequence_data = Sequence(library.load, FRAME_RATE)
+    library.sequence = sequence_data
 except Exception as e:
     print(f"Config error: {str(e)}")
     sys.exit()
+boot_profile.mark("config")
+
+# Setup motion scheduler (homing and playback moves go through it)
+try:
+    hardware.scheduler = MotionScheduler(hardware, debug_log, MOTION_CURRENT_BUDGET)
+    # SPEED override and look-ahead limits for the playback clock
+    hardware.playback_limiter = PlaybackLimiter(hardware, debug_log)
+    # PLAYBACK picks its frame from elapsed time at the limiter's rate, not from loop count
+    playback_clock = PlaybackClock(sequence_data, limiter=hardware.playback_limiter)
+except Exception as e:
+    print(f"Scheduler init failed: {str(e)}")
+    sys.exit()
+
+# Setup sensor scanner (axis feedback and current sense, one mux channel per tick)
+try:
+    hardware.scanner = SensorScanner(hardware, debug_log)
+except Exception as e:
+    print(f"Scanner init failed: {str(e)}")
+    sys.exit()
+boot_profile.mark("scheduler_scanner")
+
+# Setup E-STOP latch (driven by single control bytes in the command stream)
+try:
+    hardware.estop = EmergencyStop(hardware, debug_log)
+except Exception as e:
+    print(f"E-STOP init failed: {str(e)}")
+    sys.exit()
 
 # Setup communication
 try:
-    comm = Communication(hardware, lambda msg: debug_log(msg))
-    comm.requested_mode = None
+    comm = Communication(hardware, debug_log)
+    comm.boot_profile = boot_profile
+    comm.library = library
+    comm.config_manager = config_manager
 except Exception as e:
     print(f"Comm init failed: {str(e)}")
     sys.exit()
+boot_profile.mark("comm")
+
+# Setup dual-core runtime (core 1 starts just before the main loop)
+dual = None
+if DUAL_CORE:
+    try:
+        from dual_core import DualCore
+        dual = DualCore(hardware, comm, debug_log)
+    except Exception as e:
+        print(f"Dual-core init failed: {str(e)}")
+        sys.exit()
+
+# Setup modes (each one is imported and built the first time it is entered)
+def create_mode(index):
+    if index == 0:
+        from modes.home_mode import HomeMode
+        return HomeMode(hardware, debug_log)
+    if index == 1:
+        from modes.jog_mode import JogMode
+        return JogMode(hardware, debug_log)
+    from modes.playback_mode import PlaybackMode
+    return PlaybackMode(hardware, debug_log, sequence_data, FRAME_RATE)
+
+modes = [None, None, None]
+
+def get_mode(index):
+    if modes[index] is None:
+        modes[index] = create_mode(index)
+    return modes[index]
 
-# Setup modes
 try:
-    modes = [
-        HomeMode(hardware, lambda msg: debug_log(msg)),
-        JogMode(hardware, lambda msg: debug_log(msg)),
-        PlaybackMode(hardware, lambda msg: debug_log(msg), sequence_data, FRAME_RATE)
-    ]
     current_mode_index = 0
-    current_mode = modes[current_mode_index]
+    current_mode = get_mode(current_mode_index)
 except Exception as e:
     print(f"Mode init failed: {str(e)}")
     sys.exit()
+boot_profile.mark("modes")
 
 # Enable hardware
 try:
@@ -94,15 +163,17 @@ try:
 except Exception as e:
     print(f"Servo enable failed: {str(e)}")
     sys.exit()
+boot_profile.mark("servos")
 
 # Enter initial mode
 try:
     current_mode.enter()
-    debug_log(f"System ready | Mode: {current_mode.name}")
+    log.info("System ready | Mode: %s", current_mode.name)
 except Exception as e:
     print(f"Mode entry failed: {str(e)}")
     hardware.disable_servos()
     sys.exit()
+boot_profile.mark("enter_mode")
 
 # System state
 last_button_state = False
@@ -111,41 +182,84 @@ last_current_time = time.ticks_ms()
 last_status_time = time.ticks_ms()
 current_reading = 0.0
 overloaded = False
+estop_handled = False
 loop_counter = 0
+loop_stats = LoopStats()
+playing = False     # the playback clock has been started for this PLAYBACK entry
+last_frame = -1     # frame and sequence version last handed to the scheduler
+last_version = -1
+
+# Heap-level GC from here on; everything allocated during init is now live or garbage
+gc_monitor = GcMonitor()
+comm.gc_monitor = gc_monitor
 
 # Main loop
 try:
     debug_log("Entering main loop")
+    if dual:
+        dual.start()
     while True:
         loop_counter += 1
+        loop_stats.begin()
         #debug_log(f"Loop counter: {loop_counter}")
         
-        # Process incoming commands
-        comm.process_incoming()
+        # Process incoming commands (read and queued by core 1 in dual-core mode)
+        if dual:
+            comm.run_queued()
+        else:
+            comm.process_incoming()
+        
+        # E-STOP: nothing moves, and nothing re-enables the servos, until RESUME
+        try:
+            if hardware.estop.latched:
+                if not estop_handled:
+                    hardware.scheduler.stop()
+                    # Again here, in case a move step raced the stop on the other core
+                    hardware.disable_servos()
+                    estop_handled = True
+            elif estop_handled:
+                estop_handled = False
+                hardware.scheduler.sync()
+                if not overloaded:
+                    hardware.enable_servos()
+                log.info("Resumed after E-STOP")
+        except Exception as e:
+            log.error("E-STOP handling error: %s", e)
             
-        # Check for mode change request
+        # Mode changes and playback restarts queued by commands
         #debug_log("Checking for mode change requests")
-        if comm.requested_mode is not None:
-            requested = comm.requested_mode
-            comm.requested_mode = None  # Reset flag
+        event = comm.events.get()
+        while event is not None:
+            kind, value = event
+            event = comm.events.get()
             
-            if 0 <= requested < len(modes):
+            if kind == EVENT_MODE and 0 <= value < len(modes):
                 # Exit current mode
                 try:
                     current_mode.exit()
                 except Exception as e:
-                    debug_log(f"Mode exit error: {str(e)}")
+                    log.error("Mode exit error: %s", e)
                 
                 # Switch to requested mode
-                current_mode_index = requested
-                current_mode = modes[current_mode_index]
+                current_mode_index = value
+                current_mode = get_mode(current_mode_index)
                 
                 # Enter new mode
                 try:
                     current_mode.enter()
-                    debug_log(f"Entered {current_mode.name} mode")
+                    log.info("Entered %s mode", current_mode.name)
                 except Exception as e:
-                    debug_log(f"Mode enter error: {str(e)}")        
+                    log.error("Mode enter error: %s", e)
+            elif kind == EVENT_RESTART:
+                # The clock starts over on the next pass
+                playing = False
+                # Only PlaybackMode has something to restart
+                restart = getattr(current_mode, "restart", None)
+                if restart:
+                    try:
+                        restart()
+                    except Exception as e:
+                        log.error("Playback restart error: %s", e)
 
 
         # Handle button presses
@@ -156,12 +270,12 @@ try:
             button_released = not current_button and last_button_state
             
             if button_pressed:
-                debug_log(f"Button pressed in {current_mode.name} mode")
+                debug_log("Button pressed in %s mode", current_mode.name)
                 press_start_time = time.ticks_ms()
             
-            if button_released:
+            if button_released and not hardware.estop.latched:
                 press_duration = time.ticks_diff(time.ticks_ms(), press_start_time)
-                debug_log(f"Button released after {press_duration}ms")
+                debug_log("Button released after %dms", press_duration)
                 
                 # Short press: cycle modes
                 if press_duration < 1000:
@@ -169,53 +283,63 @@ try:
                     try:
                         current_mode.exit()
                     except Exception as e:
-                        debug_log(f"Mode exit error: {str(e)}")
+                        log.error("Mode exit error: %s", e)
                     
                     # Switch to next mode
                     current_mode_index = (current_mode_index + 1) % len(modes)
-                    current_mode = modes[current_mode_index]
+                    current_mode = get_mode(current_mode_index)
                     
                     # Enter new mode
                     try:
                         current_mode.enter()
-                        debug_log(f"Entered {current_mode.name} mode")
+                        log.info("Entered %s mode", current_mode.name)
                     except Exception as e:
-                        debug_log(f"Mode enter error: {str(e)}")
+                        log.error("Mode enter error: %s", e)
                 
                 # Long press: mode-specific action
                 else:
                     try:
                         current_mode.handle_button_press(press_duration)
                     except Exception as e:
-                        debug_log(f"Button handler error: {str(e)}")
+                        log.error("Button handler error: %s", e)
             
             last_button_state = current_button
         except Exception as e:
-            debug_log(f"Button processing error: {str(e)}")
+            log.error("Button processing error: %s", e)
+        
+        # Sample one sensor or current channel (core 1 does this in dual-core mode)
+        if not dual:
+            try:
+                hardware.scanner.update()
+            except Exception as e:
+                log.error("Sensor scan error: %s", e)
         
         # Current monitoring
         #debug_log(f"Checking curent monitoring")
         try:
             current_time = time.ticks_ms()
             if time.ticks_diff(current_time, last_current_time) >= CURRENT_CHECK_INTERVAL:
-                current_reading = read_current(hardware)  # Remove debug_log parameter
+                current_reading = hardware.scanner.current
                 last_current_time = current_time
+                hardware.scheduler.observe_current(current_reading)
                 
                 # Reset overload if current drops below threshold
                 if overloaded and current_reading <= MAX_CURRENT:
-                    debug_log("Current back to normal")
+                    log.info("Current back to normal")
                     overloaded = False
-                    hardware.enable_servos()  # Re-enable servos after overload
+                    if not hardware.estop.latched:
+                        hardware.enable_servos()  # Re-enable servos after overload
                     
                 if current_reading > MAX_CURRENT and not overloaded:
-                    # Pass debug_log lambda correctly
+                    hardware.scheduler.note_overload()
                     overloaded = handle_overload(
                         hardware, 
                         current_reading, 
                         MAX_CURRENT, 
-                        lambda msg: debug_log(msg))
+                        debug_log,
+                        None if dual else comm.wait_control)
         except Exception as e:
-            debug_log(f"Current monitor error: {str(e)}")
+            log.error("Current monitor error: %s", e)
         
         # Status updates
         #debug_log(f"Status updates")
@@ -223,50 +347,86 @@ try:
             current_time = time.ticks_ms()  # Update current time for status check
             if time.ticks_diff(current_time, last_status_time) >= STATUS_INTERVAL:
                 # Get current frame for playback mode
-                current_frame = current_mode.current_frame if hasattr(current_mode, 'current_frame') else 0
-                total_frames = len(sequence_data)
+                current_frame = playback_clock.current_frame if current_mode.name == "PLAYBACK" else 0
+                # Only PLAYBACK reports frames, so don't force the sequence to load otherwise
+                total_frames = len(sequence_data) if current_mode.name == "PLAYBACK" else 0
                 
-                comm.send_status(current_mode, current_reading, overloaded, 
-                                current_frame, total_frames)
+                if dual:
+                    dual.post_status(comm.status_snapshot(current_mode, current_reading, overloaded,
+                                                          current_frame, total_frames, loop_stats.report()))
+                else:
+                    comm.send_status(current_mode, current_reading, overloaded, 
+                                    current_frame, total_frames, loop_stats.report())
                 last_status_time = current_time
         except Exception as e:
-            debug_log(f"Status update error: {str(e)}")
+            log.error("Status update error: %s", e)
+        
+        # Update current mode (setting a servo value would re-enable it, so not while stopped)
+        if not hardware.estop.latched:
+            try:
+                if current_mode.name == "PLAYBACK":
+                    if not playing:
+                        playback_clock.restart()
+                        last_frame = -1
+                        playing = True
+                    # The clock applies SPEED and the look-ahead limits; frames
+                    # are only handed on when they change
+                    frame = playback_clock.update()
+                    if (frame != last_frame or playback_clock.version != last_version) \
+                            and frame < len(sequence_data):
+                        hardware.move_axes(sequence_data[frame])
+                        last_frame = frame
+                        last_version = playback_clock.version
+                else:
+                    playing = False
+                    current_mode.update()
+            except Exception as e:
+                log.error("Mode update error: %s", e)
+            
+            # Advance scheduled moves
+            try:
+                hardware.scheduler.update()
+            except Exception as e:
+                log.error("Scheduler error: %s", e)
         
-        # Update current mode
+        # Garbage collection only when the heap runs low, after this pass' motion is out
         try:
-            current_mode.update()
+            gc_monitor.update()
         except Exception as e:
-            debug_log(f"Mode update error: {str(e)}")
+            log.error("GC error: %s", e)
         
-        # Small sleep to prevent watchdog issues
-        time.sleep(0.01)
+        # Events held back by the flash rate limit go out once it allows
+        log.poll()
         
-        # Periodic garbage collection
-        if loop_counter % 100 == 0:
-            gc.collect()
+        # Small sleep to prevent watchdog issues; dual-core holds a fixed period instead
+        if dual:
+            busy = loop_stats.end()
+            if busy < LOOP_PERIOD_US:
+                time.sleep_us(LOOP_PERIOD_US - busy)
+        else:
+            # Woken early by input, so an E-STOP byte isn't left waiting out the tick.
+            # Commands run inside the wait, so only the time blocked on the port is idle
+            loop_stats.end(comm.wait(10))
 
 except KeyboardInterrupt:
-    debug_log("Keyboard interrupt received")
+    log.warn("Keyboard interrupt received")
 
 except Exception as e:
-    # Error handling
-    debug_log(f"MAIN LOOP CRASH: {str(e)}")
-    try:
-        s = str(e)
-        with open("error.log", "w") as f:
-            f.write(s)
-    except:
-        pass
+    # Error handling (kept in the flash event log alongside earlier events)
+    log.error("MAIN LOOP CRASH: %s", e)
 
 finally:
     # Shutdown procedure
-    debug_log("Shutdown initiated")
+    log.info("Shutdown initiated")
+    if dual:
+        dual.stop()
     try:
         hardware.disable_servos()
-        debug_log("All servos disabled")
+        log.info("All servos disabled")
     except:
-        debug_log("Failed to disable servos")
-    debug_log("System shutdown complete")
+        log.error("Failed to disable servos")
+    log.info("System shutdown complete")
+    log.flush()
     #try:
     #    os.remove("main_running")
     #except:
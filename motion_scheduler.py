@@ -0,0 +1,167 @@
+import time
+
+# Defaults used until an axis has its own values in config.json
+DEFAULT_MAX_SPEED = 240.0        # deg/s
+DEFAULT_CURRENT_GAIN = 0.004     # A per deg/s, prior before any learning
+DEFAULT_IDLE_CURRENT = 0.1       # A drawn by the board with nothing moving
+
+# Learned gains are kept inside this band so one bad sample can't wreck the model
+MIN_CURRENT_GAIN = 0.0005
+MAX_CURRENT_GAIN = 0.05
+
+# An axis only starts once it can get at least this fraction of its top speed
+MIN_START_FRACTION = 0.25
+
+# The learned idle draw is kept under this share of the budget so moves always get some
+MAX_IDLE_FRACTION = 0.5
+
+# Longest tick we integrate over, so a stalled loop doesn't become a jump
+MAX_TICK = 0.1  # s
+
+
+class MotionScheduler:
+    """Stagger and rate-limit axis moves so predicted current stays under a budget"""
+
+    def __init__(self, hardware, debug_log, current_budget, learning_rate=0.2):
+        self.hardware = hardware
+        self.debug_log = debug_log
+        self.current_budget = current_budget
+        self.learning_rate = learning_rate
+        self.idle_current = DEFAULT_IDLE_CURRENT
+        self.predicted_current = self.idle_current
+        self.gains = []
+        self.sync()
+
+    def sync(self):
+        """Rebuild per-axis state from hardware.axes, keeping learned gains"""
+        axes = self.hardware.axes
+        gains = self.gains
+        self.gains = [gains[i] if i < len(gains) else DEFAULT_CURRENT_GAIN
+                      for i in range(len(axes))]
+        self.max_speeds = [axis.get("max_speed") or DEFAULT_MAX_SPEED for axis in axes]
+        self.positions = [axis["servo"].value() for axis in axes]
+        self.targets = [None] * len(axes)
+        self.speeds = [0.0] * len(axes)
+        # Commanded values at the last current reading, to tell a still arm from one
+        # moved outside the scheduler (playback and jog write servos directly)
+        self.observed = list(self.positions)
+        self.pending = []
+        self.last_update = time.ticks_ms()
+
+    def move_axis(self, index, value):
+        """Queue a move of one axis, clamped to its limits"""
+        axis = self.hardware.axes[index]
+        value = min(max(value, axis["min"]), axis["max"])
+        if self.targets[index] is None:
+            # An idle servo can be written outside the scheduler, e.g. rebuilt
+            # or recalibrated by a config reload, so step from where it is now
+            self.positions[index] = axis["servo"].value()
+        self.targets[index] = value
+        if index not in self.pending:
+            self.pending.append(index)
+
+    def move_all(self, values):
+        """Queue a move for every axis, e.g. a playback frame"""
+        for index, value in enumerate(values):
+            self.move_axis(index, value)
+
+    def busy(self):
+        return len(self.pending) > 0
+
+    def stop(self):
+        """Drop all queued moves and hold the current commanded positions"""
+        for index in self.pending:
+            self.targets[index] = None
+            self.speeds[index] = 0.0
+        self.pending = []
+        self.predicted_current = self.idle_current
+
+    def update(self):
+        """Advance queued moves by one tick within the current budget"""
+        now = time.ticks_ms()
+        dt = time.ticks_diff(now, self.last_update) / 1000
+        self.last_update = now
+        # Axes that finished last tick are idle from now on
+        for index in range(len(self.speeds)):
+            if self.targets[index] is None:
+                self.speeds[index] = 0.0
+        if not self.pending or dt <= 0:
+            return
+        dt = min(dt, MAX_TICK)
+
+        # Hand out the headroom in request order: earlier moves keep priority,
+        # later ones get what is left or wait for a later tick
+        headroom = self.current_budget - self.idle_current
+        moving = 0
+        finished = 0
+        for index in self.pending:
+            gain = self.gains[index]
+            max_speed = self.max_speeds[index]
+            speed = headroom / gain
+            if speed >= max_speed:
+                speed = max_speed
+            elif speed < max_speed * MIN_START_FRACTION:
+                # The first axis always crawls so a tight budget can't stall everything
+                speed = max_speed * MIN_START_FRACTION if moving == 0 else 0.0
+
+            self.speeds[index] = speed
+            if speed == 0.0:
+                continue
+            moving += 1
+            headroom -= gain * speed
+
+            position = self.positions[index]
+            remaining = self.targets[index] - position
+            step = speed * dt
+            if abs(remaining) <= step:
+                position = self.targets[index]
+                self.targets[index] = None
+                finished += 1
+            elif remaining > 0:
+                position += step
+            else:
+                position -= step
+            self.positions[index] = position
+            self.hardware.axes[index]["servo"].value(position)
+
+        # Rebuilt only on the tick a move ends, so steady motion allocates no lists
+        if finished:
+            self.pending = [index for index in self.pending if self.targets[index] is not None]
+        self.predicted_current = self.current_budget - headroom
+
+    def observe_current(self, measured):
+        """Fit the per-axis current model to a reading from the current sense"""
+        total_sq = 0.0
+        predicted = self.idle_current
+        for index, speed in enumerate(self.speeds):
+            total_sq += speed * speed
+            predicted += self.gains[index] * speed
+
+        if total_sq == 0.0:
+            # Nothing scheduled; only a still arm gives the idle draw
+            still = True
+            observed = self.observed
+            for index, axis in enumerate(self.hardware.axes):
+                value = axis["servo"].value()
+                if value != observed[index]:
+                    observed[index] = value
+                    still = False
+            if still:
+                idle = self.idle_current + 0.1 * (measured - self.idle_current)
+                self.idle_current = min(idle, self.current_budget * MAX_IDLE_FRACTION)
+            return
+
+        # Normalised LMS step shared out by how fast each axis was moving
+        error = measured - predicted
+        step = self.learning_rate * error / total_sq
+        for index, speed in enumerate(self.speeds):
+            if speed > 0.0:
+                gain = self.gains[index] + step * speed
+                self.gains[index] = min(max(gain, MIN_CURRENT_GAIN), MAX_CURRENT_GAIN)
+
+    def note_overload(self):
+        """The model under-predicted badly enough to trip, so back it off"""
+        for index, speed in enumerate(self.speeds):
+            if speed > 0.0:
+                self.gains[index] = min(self.gains[index] * 1.25, MAX_CURRENT_GAIN)
+        self.debug_log("Motion scheduler: overload, raising current estimates")
@@ -0,0 +1,54 @@
+import time
+
+
+class PlaybackClock:
+    """Picks the active frame of a Sequence from elapsed ticks_ms, not a loop counter
+
+    Loop overruns no longer stretch the program: whichever frame is due at
+    the current wall-clock time is the one returned. With a PlaybackLimiter
+    the elapsed time is scaled by its rate (SPEED override and look-ahead).
+    """
+
+    def __init__(self, sequence, loop=True, limiter=None):
+        self.sequence = sequence
+        self.loop = loop
+        self.limiter = limiter
+        self.restart()
+
+    def restart(self):
+        self.version = self.sequence.version
+        self.last = time.ticks_ms()
+        self.position = 0.0  # ms into the sequence, advanced at the playback rate
+        self.rate = 1.0
+        self.current_frame = 0
+        self.cycles = 0
+
+    def elapsed(self):
+        return int(self.position)
+
+    def update(self):
+        """Return the index of the frame due now"""
+        if self.version != self.sequence.version:
+            # A different sequence was selected; play it from its start
+            self.restart()
+        duration = self.sequence.duration()
+        if duration == 0:
+            self.current_frame = 0
+            return 0
+        now = time.ticks_ms()
+        dt = time.ticks_diff(now, self.last)
+        self.last = now
+        if self.limiter is not None:
+            self.rate = self.limiter.update(self.sequence, self.current_frame, dt, self.loop)
+        position = self.position + dt * self.rate
+        if position >= duration:
+            if self.loop:
+                # Carry the overshoot into the next cycle so cycle time stays exact
+                cycles = int(position // duration)
+                self.cycles += cycles
+                position -= cycles * duration
+            else:
+                position = duration - 1
+        self.position = position
+        self.current_frame = self.sequence.frame_at(int(position))
+        return self.current_frame
@@ -0,0 +1,116 @@
+import math
+from array import array
+from motion_scheduler import DEFAULT_MAX_SPEED
+
+# Defaults used until an axis has its own value in config.json
+DEFAULT_MAX_ACCEL = 1200.0  # deg/s^2
+
+# Range accepted for the SPEED:x override (1.0 = as recorded)
+SPEED_MIN = 0.1
+SPEED_MAX = 2.0
+
+LOOKAHEAD_FRAMES = 4   # segments checked ahead of the current frame
+RAMP_UP = 0.5          # rate gained per second once a slow stretch has passed
+
+
+class PlaybackLimiter:
+    """Time-scales playback: the SPEED override, capped by a look-ahead over the next frames
+
+    Each upcoming segment is checked against the axes' max_speed and
+    max_accel and against the scheduler's current model, and the clock runs
+    no faster than the tightest of them allows. Scaling time rather than
+    clipping moves keeps every axis on the recorded path. The rate drops at
+    once when a hard segment comes into view and climbs back gradually.
+    """
+
+    def __init__(self, hardware, debug_log):
+        self.hardware = hardware
+        self.debug_log = debug_log
+        self.override = 1.0
+        self.limit = SPEED_MAX
+        self.rate = 1.0
+        self.window_frame = -1
+        self.window_version = -1
+        self.sync()
+
+    def sync(self):
+        """Rebuild per-axis limits from hardware.axes"""
+        axes = self.hardware.axes
+        self.max_speeds = [axis.get("max_speed") or DEFAULT_MAX_SPEED for axis in axes]
+        self.max_accels = [axis.get("max_accel") or DEFAULT_MAX_ACCEL for axis in axes]
+        # Signed velocities of the previous segment, reused on every look-ahead
+        self.velocities = array('f', [0.0] * len(axes))
+        self.window_frame = -1
+
+    def set_override(self, speed):
+        """SPEED:x; False if outside SPEED_MIN..SPEED_MAX"""
+        if not SPEED_MIN <= speed <= SPEED_MAX:
+            self.debug_log("Playback speed out of range: %s", speed)
+            return False
+        self.override = speed
+        self.debug_log("Playback speed set to %s", speed)
+        return True
+
+    def update(self, sequence, frame, dt_ms, loop=True):
+        """Sequence ms to advance per elapsed ms from this frame on"""
+        if frame != self.window_frame or sequence.version != self.window_version:
+            # The window only moves when the frame does, so this runs at the frame rate
+            self.limit = self.look_ahead(sequence, frame, loop)
+            self.window_frame = frame
+            self.window_version = sequence.version
+        target = min(self.override, self.limit)
+        if target < self.rate:
+            self.rate = target
+        else:
+            self.rate = min(target, self.rate + RAMP_UP * dt_ms / 1000)
+        return self.rate
+
+    def look_ahead(self, sequence, frame, loop=True):
+        """Highest rate at which the next LOOKAHEAD_FRAMES segments stay within limits"""
+        count = len(sequence)
+        if count < 2:
+            return SPEED_MAX
+        times = sequence.times
+        scheduler = self.hardware.scheduler
+        # Floored at 0: an idle draw at or over budget leaves no room, not a negative one
+        headroom = max(0.0, scheduler.current_budget - scheduler.idle_current)
+        gains = scheduler.gains
+        velocities = self.velocities
+        axes = len(velocities)
+        limit = SPEED_MAX
+        index = frame
+        start = sequence[index]
+        for step in range(LOOKAHEAD_FRAMES):
+            following = index + 1
+            if following < count:
+                seconds = (times[following] - times[index]) / 1000
+            elif loop:
+                # The last frame holds for its period before the program wraps
+                following = 0
+                seconds = (sequence.duration() - times[index] + times[0]) / 1000
+            else:
+                break
+            end = sequence[following]
+            if seconds <= 0:
+                index = following
+                start = end
+                continue
+            draw = 0.0
+            for axis in range(axes):
+                velocity = (end[axis] - start[axis]) / seconds
+                speed = abs(velocity)
+                if speed * limit > self.max_speeds[axis]:
+                    limit = self.max_speeds[axis] / speed
+                draw += gains[axis] * speed
+                # Acceleration scales with the square of the rate
+                if step:
+                    accel = abs(velocity - velocities[axis]) / seconds
+                    if accel * limit * limit > self.max_accels[axis]:
+                        limit = math.sqrt(self.max_accels[axis] / accel)
+                velocities[axis] = velocity
+            # A hold segment draws nothing extra, so it never caps the rate
+            if draw > 0 and draw * limit > headroom:
+                limit = headroom / draw
+            index = following
+            start = end
+        return max(limit, SPEED_MIN)
@@ -0,0 +1,80 @@
+from servo import servo2040
+
+# Sensor voltage range mapped onto each axis' min..max unless config.json says otherwise
+DEFAULT_SENSOR_MIN_V = 0.0
+DEFAULT_SENSOR_MAX_V = 3.3
+
+# Every Nth tick samples the current channel instead of an axis sensor
+CURRENT_EVERY = 2
+
+# Exponential filter weights (0..1, higher follows faster)
+SENSOR_ALPHA = 0.3
+CURRENT_ALPHA = 0.4
+
+
+class SensorScanner:
+    """Round-robin the analog mux, one channel per tick, into filtered per-axis readings"""
+
+    def __init__(self, hardware, debug_log, current_every=CURRENT_EVERY):
+        self.hardware = hardware
+        self.debug_log = debug_log
+        self.current_every = current_every
+        self.current = 0.0
+        self.current_primed = False
+        self.tick = 0
+        self.next_axis = 0
+        self.sync()
+
+    def sync(self):
+        """Rebuild per-axis buffers from hardware.axes"""
+        axes = self.hardware.axes
+        self.voltages = [0.0] * len(axes)
+        self.primed = [False] * len(axes)
+        self.next_axis = 0
+
+    def update(self):
+        """Sample one mux channel; never waits on the ADC more than one read"""
+        if self.hardware.adc_lock:
+            with self.hardware.adc_lock:
+                self.sample()
+        else:
+            self.sample()
+
+    def sample(self):
+        self.tick += 1
+        axes = self.hardware.axes
+        if not axes or self.tick % self.current_every == 0:
+            self.hardware.mux.select(servo2040.CURRENT_SENSE_ADDR)
+            sample = self.hardware.cur_adc.read_current()
+            if self.current_primed:
+                self.current += CURRENT_ALPHA * (sample - self.current)
+            else:
+                self.current = sample
+                self.current_primed = True
+            return
+
+        index = self.next_axis
+        self.next_axis = (index + 1) % len(axes)
+        self.hardware.mux.select(axes[index]["sensor_addr"])
+        sample = self.hardware.sen_adc.read_voltage()
+        if self.primed[index]:
+            self.voltages[index] += SENSOR_ALPHA * (sample - self.voltages[index])
+        else:
+            self.voltages[index] = sample
+            self.primed[index] = True
+
+    def measured(self, index):
+        """Filtered sensor reading for an axis in axis units, or None before the first sample"""
+        if not self.primed[index]:
+            return None
+        axis = self.hardware.axes[index]
+        low_v = axis.get("sensor_min_v")
+        high_v = axis.get("sensor_max_v")
+        if low_v is None:
+            low_v = DEFAULT_SENSOR_MIN_V
+        if high_v is None:
+            high_v = DEFAULT_SENSOR_MAX_V
+        if high_v == low_v:
+            return None
+        fraction = (self.voltages[index] - low_v) / (high_v - low_v)
+        return axis["min"] + fraction * (axis["max"] - axis["min"])
@@ -0,0 +1,77 @@
+class Sequence:
+    """List-like playback sequence that is only parsed on first use
+
+    The loader returns (frames, times): one list of axis values per frame and
+    each frame's start time in ms from the beginning of the sequence.
+    """
+
+    def __init__(self, loader, frame_rate=30):
+        self.loader = loader
+        self.frame_period = 1000 // frame_rate
+        self.frames = None
+        self.times = None
+        self.cursor = 0
+        # Bumped on replace() so a PlaybackClock knows to start over
+        self.version = 0
+
+    def replace(self, loader):
+        """Swap in another program in place; whoever holds this Sequence sees the new one"""
+        self.loader = loader
+        self.frames = None
+        self.times = None
+        self.cursor = 0
+        self.version += 1
+
+    def load(self):
+        if self.frames is None:
+            self.frames, self.times = self.loader()
+            self.cursor = 0
+        return self.frames
+
+    def is_loaded(self):
+        return self.frames is not None
+
+    def __len__(self):
+        return len(self.load())
+
+    def __getitem__(self, index):
+        return self.load()[index]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def duration(self):
+        """Length in ms, holding the last frame for one frame period"""
+        if not self.load():
+            return 0
+        return self.times[-1] + self.frame_period
+
+    def frame_at(self, elapsed):
+        """Index of the frame active `elapsed` ms into the sequence
+
+        Playback mostly moves forward a frame or two per call, so the last
+        answer is tried first and a binary search covers jumps and rewinds.
+        """
+        times = self.times
+        count = len(self.load())
+        if count == 0:
+            return 0
+        cursor = self.cursor
+        if times[cursor] <= elapsed:
+            # Walk forward a couple of frames before falling back to a search
+            for _ in range(3):
+                if cursor + 1 >= count or times[cursor + 1] > elapsed:
+                    self.cursor = cursor
+                    return cursor
+                cursor += 1
+
+        low = 0
+        high = count - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if times[middle] <= elapsed:
+                low = middle
+            else:
+                high = middle - 1
+        self.cursor = low
+        return low
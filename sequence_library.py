@@ -0,0 +1,327 @@
+import json
+import struct
+import time
+import uos
+from array import array
+
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+LIBRARY_DIR = 'sequences'
+INDEX_FILE = LIBRARY_DIR + '/index.json'
+INDEX_TEMP = LIBRARY_DIR + '/index.tmp'
+# The old single program; imported under this name so existing setups keep working
+LEGACY_FILE = 'sequence.csv'
+LEGACY_NAME = 'sequence'
+
+# .seq layout: header, int32 start times (ms), then float32 values frame by frame
+SEQ_MAGIC = b'SEQ1'
+SEQ_HEADER = '<4sHHI'  # magic, axis count, reserved, frame count
+
+BLOCK_FRAMES = 32   # frames decoded per cache block
+CACHE_BLOCKS = 16   # blocks kept across all sequences (16 * 32 * 5 axes * 4 B = 10 KB)
+CACHE_TIMES = 4     # sequences whose times arrays stay loaded
+CHUNK = 1024        # bytes per read while checksumming
+
+
+def checksum(data, value=0):
+    """CRC-32 where the port has binascii.crc32, else a rolling hash; chain over chunks"""
+    if crc32:
+        return crc32(data, value)
+    for byte in bytes(data):
+        value = (value * 31 + byte) & 0xFFFFFFFF
+    return value
+
+
+def exists(path):
+    try:
+        uos.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+class LibraryFrames:
+    """List-like frames of one library sequence, decoded a block at a time through the cache"""
+
+    def __init__(self, library, entry):
+        self.library = library
+        self.entry = entry
+        self.count = entry["frames"]
+        self.axes = entry["axes"]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("frame index out of range")
+        block = self.library.block(self.entry, index // BLOCK_FRAMES)
+        start = (index % BLOCK_FRAMES) * self.axes
+        return block[start:start + self.axes]
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+
+class SequenceLibrary:
+    """Named sequences stored as .seq files under sequences/, listed in a small index
+
+    CSVs copied into the directory (and the old sequence.csv) are converted
+    on scan(), run at boot and by SCAN_SEQUENCES. select() swaps the
+    playback Sequence's backing in place, so switching jobs costs one
+    times-array read instead of a CSV parse.
+    """
+
+    def __init__(self, hardware, debug_log, parse_csv, sequence=None):
+        self.hardware = hardware
+        self.debug_log = debug_log
+        self.parse_csv = parse_csv  # filename -> (frames, times), e.g. ConfigManager.load_sequence
+        self.sequence = sequence
+        self.entries = {}
+        self.selected = None
+        self.verified = set()
+        # LRU caches: key -> [last use, value]
+        self.blocks = {}
+        self.times = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.scan_us = None  # how long the last scan() took
+        self.read_index()
+
+    # Index
+
+    def read_index(self):
+        try:
+            with open(INDEX_FILE, 'r') as f:
+                index = json.load(f)
+            self.entries = {entry["name"]: entry for entry in index.get("sequences", [])}
+            self.selected = index.get("selected")
+        except (OSError, ValueError) as e:
+            self.debug_log("No sequence index: %s", e)
+            self.entries = {}
+
+    def write_index(self):
+        index = {"selected": self.selected, "sequences": list(self.entries.values())}
+        with open(INDEX_TEMP, 'w') as f:
+            json.dump(index, f)
+        # Renamed over the old index so a power cut can't leave half a file
+        try:
+            uos.remove(INDEX_FILE)
+        except OSError:
+            pass
+        uos.rename(INDEX_TEMP, INDEX_FILE)
+
+    def scan(self):
+        """Convert new or changed CSVs, pick up bare .seq uploads and forget deleted files"""
+        started = time.ticks_us()
+        if not exists(LIBRARY_DIR):
+            uos.mkdir(LIBRARY_DIR)
+        changed = False
+        sources = []
+        if exists(LEGACY_FILE):
+            sources.append((LEGACY_NAME, LEGACY_FILE))
+        names = uos.listdir(LIBRARY_DIR)
+        for filename in names:
+            if filename.endswith('.csv'):
+                sources.append((filename[:-4], LIBRARY_DIR + '/' + filename))
+
+        for name, path in sources:
+            stat = uos.stat(path)
+            source = [stat[6], stat[8]]
+            entry = self.entries.get(name)
+            if entry is None or entry.get("source") != source:
+                frames, times = self.parse_csv(path)
+                if frames:
+                    self.write(name, frames, times, source)
+                    changed = True
+
+        for filename in names:
+            name = filename[:-4]
+            if filename.endswith('.seq') and name not in self.entries:
+                entry = self.read_header(name)
+                if entry:
+                    self.entries[name] = entry
+                    changed = True
+
+        for name in list(self.entries):
+            if not exists(self.entries[name]["file"]):
+                del self.entries[name]
+                self.forget(name)
+                changed = True
+
+        if self.selected not in self.entries:
+            selected = LEGACY_NAME if LEGACY_NAME in self.entries else None
+            if selected is None and self.entries:
+                selected = sorted(self.entries)[0]
+            # An empty library stays at None without rewriting the index each scan
+            if selected != self.selected:
+                self.selected = selected
+                changed = True
+        if changed:
+            self.write_index()
+        self.scan_us = time.ticks_diff(time.ticks_us(), started)
+        self.debug_log("Sequence scan took %dus", self.scan_us)
+        return changed
+
+    # Files
+
+    def write(self, name, frames, times, source=None):
+        """Store frames/times as sequences/<name>.seq and index it"""
+        path = LIBRARY_DIR + '/' + name + '.seq'
+        count = len(frames)
+        axes = len(frames[0]) if count else 0
+        crc = 0
+        with open(path, 'wb') as f:
+            f.write(struct.pack(SEQ_HEADER, SEQ_MAGIC, axes, 0, count))
+            stamps = array('i', times)
+            f.write(stamps)
+            crc = checksum(stamps, crc)
+            for frame in frames:
+                values = array('f', frame)
+                f.write(values)
+                crc = checksum(values, crc)
+        header = struct.calcsize(SEQ_HEADER)
+        self.forget(name)
+        self.entries[name] = {
+            "name": name,
+            "file": path,
+            "frames": count,
+            "axes": axes,
+            "end_ms": times[-1] if count else 0,  # start of the last frame
+            "times_offset": header,
+            "frames_offset": header + 4 * count,
+            "crc": crc,
+            "source": source
+        }
+        self.verified.add(name)
+        self.debug_log("Stored sequence %s: %d frames", name, count)
+
+    def read_header(self, name):
+        """Index entry for a .seq file copied in without one"""
+        path = LIBRARY_DIR + '/' + name + '.seq'
+        header = struct.calcsize(SEQ_HEADER)
+        try:
+            with open(path, 'rb') as f:
+                magic, axes, _, count = struct.unpack(SEQ_HEADER, f.read(header))
+                if magic != SEQ_MAGIC:
+                    return None
+                last = 0
+                if count:
+                    f.seek(header + 4 * (count - 1))
+                    last = struct.unpack('<i', f.read(4))[0]
+        except (OSError, ValueError) as e:
+            self.debug_log("Bad sequence file %s: %s", path, e)
+            return None
+        entry = {"name": name, "file": path, "frames": count, "axes": axes, "end_ms": last,
+                 "times_offset": header, "frames_offset": header + 4 * count, "crc": None, "source": None}
+        entry["crc"] = self.file_checksum(entry)
+        return entry
+
+    def file_checksum(self, entry):
+        crc = 0
+        buffer = bytearray(CHUNK)
+        with open(entry["file"], 'rb') as f:
+            f.seek(entry["times_offset"])
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                crc = checksum(buffer if read == CHUNK else buffer[:read], crc)
+        return crc
+
+    # Caches
+
+    def touch(self, cache, key, value=None, limit=0):
+        """LRU lookup (value None) or insert; evicts the least recently used past limit"""
+        self.clock += 1
+        if value is None:
+            slot = cache.get(key)
+            if slot is None:
+                return None
+            slot[0] = self.clock
+            return slot[1]
+        cache[key] = [self.clock, value]
+        if len(cache) > limit:
+            oldest = None
+            for other, slot in cache.items():
+                if oldest is None or slot[0] < cache[oldest][0]:
+                    oldest = other
+            del cache[oldest]
+        return value
+
+    def forget(self, name):
+        """Drop cached blocks and times of a sequence that was rewritten or removed"""
+        for key in [key for key in self.blocks if key[0] == name]:
+            del self.blocks[key]
+        self.times.pop(name, None)
+
+    def block(self, entry, index):
+        """Frames [index * BLOCK_FRAMES ...) of a sequence as one flat float array"""
+        key = (entry["name"], index)
+        block = self.touch(self.blocks, key)
+        if block is not None:
+            self.hits += 1
+            return block
+        self.misses += 1
+        axes = entry["axes"]
+        first = index * BLOCK_FRAMES
+        count = min(BLOCK_FRAMES, entry["frames"] - first)
+        with open(entry["file"], 'rb') as f:
+            f.seek(entry["frames_offset"] + first * axes * 4)
+            block = array('f', f.read(count * axes * 4))
+        return self.touch(self.blocks, key, block, CACHE_BLOCKS)
+
+    def load_times(self, entry):
+        times = self.touch(self.times, entry["name"])
+        if times is None:
+            with open(entry["file"], 'rb') as f:
+                f.seek(entry["times_offset"])
+                times = array('i', f.read(4 * entry["frames"]))
+            self.touch(self.times, entry["name"], times, CACHE_TIMES)
+        return times
+
+    # Playback
+
+    def load(self, name=None):
+        """(frames, times) for a sequence, frames decoded lazily; empty if unknown"""
+        entry = self.entries.get(self.selected if name is None else name)
+        if entry is None:
+            return [], array('i')
+        return LibraryFrames(self, entry), self.load_times(entry)
+
+    def select(self, name):
+        """Make a sequence the playback program; False if unknown or corrupt"""
+        entry = self.entries.get(name)
+        if entry is None:
+            self.debug_log("Unknown sequence: %s", name)
+            return False
+        # Checked once per boot; after that switching is just the times read
+        if name not in self.verified:
+            if entry["crc"] is not None and self.file_checksum(entry) != entry["crc"]:
+                self.debug_log("Checksum mismatch in %s", entry["file"])
+                return False
+            self.verified.add(name)
+        if name != self.selected:
+            self.selected = name
+            self.write_index()
+        if self.sequence is not None:
+            self.sequence.replace(lambda: self.load(name))
+            self.sequence.load()
+        return True
+
+    def listing(self):
+        """Summary for LIST_SEQUENCES"""
+        return {
+            "selected": self.selected,
+            "sequences": [{"name": entry["name"], "frames": entry["frames"], "end_ms": entry["end_ms"]}
+                          for entry in self.entries.values()],
+            "cache": {"blocks": len(self.blocks), "hits": self.hits, "misses": self.misses},
+            "scan_us": self.scan_us
+        }
@@ -0,0 +1,255 @@
+"""Command-line front end to ServoClient for scripting and benchmarks.
+
+    python servo_cli.py --port /dev/ttyACM0 home-all
+    python servo_cli.py set-mode 2
+    python servo_cli.py select-sequence pick_place
+    python servo_cli.py push-config config.json
+    python servo_cli.py tail-status --format csv --count 100
+    python servo_cli.py bench --count 1000
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import wait, TimeoutError as FutureTimeoutError
+
+from clock_sync import percentile
+from servo_client import ServoClient
+
+
+def open_client(args):
+    client = ServoClient()
+    if args.port:
+        client.connect(args.port)
+    elif client.auto_connect() is None:
+        sys.exit("No Servo2040 found")
+    return client
+
+
+def reply(future, timeout, command):
+    """The future's result; exits with an error naming the command if no reply came"""
+    try:
+        return future.result(timeout=timeout)
+    except (TimeoutError, FutureTimeoutError):
+        sys.exit(f"{command}: no reply within {timeout:g}s")
+
+
+def run_command(client, future, timeout, command):
+    """Wait for one ACK; exit status says whether the device accepted it"""
+    ack = reply(future, timeout, command)
+    print(f"{ack.cmd}: {'ok' if ack.ok else 'failed'}")
+    return 0 if ack.ok else 1
+
+
+def tail_status(client, args):
+    done = threading.Event()
+    count = [0]
+
+    def write_status(status):
+        if args.format == "json":
+            line = json.dumps(status.raw)
+        else:
+            fields = [f"{status.received:.3f}", str(status.t), status.mode,
+                      f"{status.current:.3f}", str(int(status.overloaded))]
+            fields += [f"{axis.position:.2f}" for axis in status.axes]
+            line = ",".join(fields)
+        print(line, flush=True)
+        count[0] += 1
+        if args.count and count[0] >= args.count:
+            done.set()
+
+    if args.format == "csv":
+        print("host_time,device_t,mode,current,overloaded,axes...", flush=True)
+    client.on_status(write_status)
+    try:
+        done.wait()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def control(client, future, timeout, command):
+    """Wait for an E-STOP/RESUME confirmation and print its timing"""
+    report = reply(future, timeout, command)
+    line = f"{report.state}: round trip {report.round_trip * 1000:.2f}ms"
+    if report.latency_us is not None:
+        line += f", servos off {report.latency_us}us after the byte was read"
+    print(line)
+    return 0
+
+
+def list_sequences(client, args):
+    command = "SCAN_SEQUENCES" if args.scan else "LIST_SEQUENCES"
+    future = client.scan_sequences() if args.scan else client.list_sequences()
+    listing = reply(future, args.timeout, command)
+    for entry in listing.get("sequences", []):
+        marker = "*" if entry["name"] == listing.get("selected") else " "
+        print(f"{marker} {entry['name']:<20} {entry['frames']:>6} frames {entry['end_ms'] / 1000:>8.1f}s")
+    cache = listing.get("cache", {})
+    print(f"cache: {cache.get('blocks', 0)} blocks, {cache.get('hits', 0)} hits, {cache.get('misses', 0)} misses")
+    if listing.get("scan_us") is not None:
+        print(f"last scan: {listing['scan_us'] / 1000:.1f}ms")
+    return 0
+
+
+def config_report(client, future, timeout, command):
+    """Print what a config reload changed and how long the device took to apply it"""
+    report = reply(future, timeout, command)
+    changes = ", ".join(f"{count} {name}" for name, count in report["changes"].items() if count) or "no changes"
+    print(f"applied in {report['reload_us']}us: {changes}")
+    for axis in report["axes"]:
+        print(f"  {axis['name']:<8} pin {axis['pin']:>2}  {axis['min']:>7.1f}..{axis['max']:<7.1f} home {axis['home']}")
+    return 0
+
+
+def command_stats(client, args):
+    report = reply(client.command_stats(), args.timeout, "CMD_STATS")
+    print(f"{'command':<18} {'count':>7} {'min_us':>8} {'mean_us':>8} {'max_us':>8}")
+    for name, stats in sorted(report["commands"].items()):
+        print(f"{name:<18} {stats['count']:>7} {stats['min_us']:>8} {stats['mean_us']:>8} {stats['max_us']:>8}")
+    print(f"unknown commands: {report['unknown']}")
+    return 0
+
+
+def log_dump(client, args):
+    done = threading.Event()
+
+    def write_line(line, received):
+        if line.startswith("LOG_DUMP:"):
+            print(line[9:], flush=True)
+            if line == "LOG_DUMP:END":
+                done.set()
+
+    client.on_line(write_line)
+    client.log_dump()
+    return 0 if done.wait(args.timeout) else 1
+
+
+def bench(client, args):
+    """Push commands as fast as the link takes them with a bounded window in flight"""
+    latencies = []
+    futures = []
+    in_flight = []
+
+    def record(future, sent):
+        if future.exception() is None:
+            latencies.append(time.monotonic() - sent)
+
+    start = time.monotonic()
+    for _ in range(args.count):
+        sent = time.monotonic()
+        future = client.ping() if args.bench_command == "PING" else client.send(args.bench_command)
+        future.add_done_callback(lambda f, s=sent: record(f, s))
+        futures.append(future)
+        in_flight.append(future)
+        if len(in_flight) >= args.window:
+            finished, pending = wait(in_flight, timeout=args.timeout, return_when="FIRST_COMPLETED")
+            in_flight = list(pending)
+            if not finished:
+                break
+    wait(in_flight, timeout=args.timeout)
+    elapsed = time.monotonic() - start
+
+    completed = sum(1 for f in futures if f.done() and f.exception() is None)
+    print(f"{completed}/{args.count} {args.bench_command} in {elapsed:.3f}s "
+          f"= {completed / elapsed:.0f} cmd/s")
+    if latencies:
+        print(f"latency p50={percentile(latencies, 0.5) * 1000:.2f}ms "
+              f"p95={percentile(latencies, 0.95) * 1000:.2f}ms "
+              f"max={max(latencies) * 1000:.2f}ms")
+    return 0 if completed == args.count else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servo2040 command-line client")
+    parser.add_argument("--port", help="serial port (default: auto-detect)")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds to wait for replies")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("home-all", help="home every axis")
+    home_axis = commands.add_parser("home-axis", help="home one axis")
+    home_axis.add_argument("index", type=int)
+    set_mode = commands.add_parser("set-mode", help="switch mode (0=HOME, 1=JOG, 2=PLAYBACK)")
+    set_mode.add_argument("mode", type=int)
+    commands.add_parser("restart-playback", help="restart the playback sequence")
+    speed = commands.add_parser("speed", help="scale playback time (1.0 = as recorded)")
+    speed.add_argument("speed", type=float)
+    send = commands.add_parser("send", help="send a raw command line and wait for its ACK")
+    send.add_argument("line")
+    commands.add_parser("log-dump", help="print the device event log")
+    commands.add_parser("cmd-stats", help="per-command call count and handling time on the device")
+    commands.add_parser("reload-config", help="re-read config.json on the device without restarting")
+    push = commands.add_parser("push-config", help="apply an axis table and save it as the device's config.json")
+    push.add_argument("file", help="config.json to send")
+    sequences = commands.add_parser("list-sequences", help="list the sequences stored on the device (* = selected)")
+    sequences.add_argument("--scan", action="store_true", help="rescan for CSVs copied in since boot first")
+    select = commands.add_parser("select-sequence", help="make a stored sequence the playback program")
+    select.add_argument("name")
+    commands.add_parser("estop", help="disable every servo at once (main.py keeps running)")
+    commands.add_parser("resume", help="release the E-STOP latch")
+
+    tail = commands.add_parser("tail-status", help="stream STATUS lines")
+    tail.add_argument("--format", choices=("csv", "json"), default="json")
+    tail.add_argument("--count", type=int, default=0, help="stop after N (default: forever)")
+
+    ping = commands.add_parser("ping", help="measure round-trip time")
+    ping.add_argument("--count", type=int, default=10)
+
+    bench_parser = commands.add_parser("bench", help="measure command throughput")
+    bench_parser.add_argument("--count", type=int, default=1000)
+    bench_parser.add_argument("--window", type=int, default=32, help="commands in flight")
+    bench_parser.add_argument("--command", dest="bench_command", default="PING",
+                              help="command line to send (default PING)")
+
+    args = parser.parse_args(argv)
+    client = open_client(args)
+    try:
+        if args.command == "home-all":
+            return run_command(client, client.home_all(), args.timeout, "HOME_ALL")
+        if args.command == "home-axis":
+            return run_command(client, client.home_axis(args.index), args.timeout, "HOME_AXIS")
+        if args.command == "set-mode":
+            return run_command(client, client.set_mode(args.mode), args.timeout, "SET_MODE")
+        if args.command == "restart-playback":
+            return run_command(client, client.restart_playback(), args.timeout, "RESTART_PLAYBACK")
+        if args.command == "speed":
+            return run_command(client, client.set_speed(args.speed), args.timeout, "SPEED")
+        if args.command == "send":
+            return run_command(client, client.send(args.line), args.timeout, args.line)
+        if args.command == "reload-config":
+            return config_report(client, client.reload_config(), args.timeout, "RELOAD_CONFIG")
+        if args.command == "push-config":
+            with open(args.file) as f:
+                config = json.load(f)
+            return config_report(client, client.push_config(config), args.timeout, "CONFIG_PUSH")
+        if args.command == "list-sequences":
+            return list_sequences(client, args)
+        if args.command == "select-sequence":
+            return run_command(client, client.select_sequence(args.name), args.timeout, "SELECT_SEQUENCE")
+        if args.command == "estop":
+            return control(client, client.estop(), args.timeout, "E-STOP")
+        if args.command == "resume":
+            return control(client, client.resume(), args.timeout, "RESUME")
+        if args.command == "cmd-stats":
+            return command_stats(client, args)
+        if args.command == "log-dump":
+            return log_dump(client, args)
+        if args.command == "tail-status":
+            return tail_status(client, args)
+        if args.command == "ping":
+            for _ in range(args.count):
+                rtt = reply(client.ping(), args.timeout, "PING")
+                print(f"rtt={rtt * 1000:.2f}ms")
+                time.sleep(0.1)
+            print(json.dumps(client.clock.stats()))
+            return 0
+        if args.command == "bench":
+            return bench(client, args)
+    finally:
+        client.disconnect()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
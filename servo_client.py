@@ -0,0 +1,621 @@
+"""GUI-free client for the Servo2040 serial protocol.
+
+Owns the port, the reader thread and the line protocol (STATUS, ACK, PONG,
+LOG, SEQUENCES, AXES and CMD_STATS lines), plus discovery and a supervisor
+that reconnects with backoff. Commands return futures that resolve on the
+device's ACK, and status updates are delivered to callbacks as typed
+Status objects. Callbacks run on the reader thread; GUIs should hand them
+to their own event loop.
+"""
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import serial
+from serial.tools import list_ports
+
+from clock_sync import ClockSync, ping_command, parse_pong
+
+BAUDRATE = 115200
+CANDIDATE_PORTS = [
+    'COM6',                           # Windows
+    '/dev/ttyACM0', '/dev/ttyACM1',   # Linux
+    '/dev/cu.usbmodem'                # macOS
+]
+
+# USB vendor ID of RP2040 boards (the Servo2040 enumerates under it)
+RP2040_VID = 0x2E8A
+
+PROBE_TIMEOUT = 0.3     # s a candidate port gets to answer the handshake
+LINK_TIMEOUT = 3.0      # s of silence before a connected link is treated as dead
+ACK_TIMEOUT = 5.0       # s a command waits for its ACK before it is failed
+BACKOFF_INITIAL = 0.05  # s before the first reconnect retry
+BACKOFF_MAX = 2.0       # s cap on the reconnect retry interval
+
+# Control characters understood by the MicroPython REPL
+CTRL_C = b'\x03'
+CTRL_D = b'\x04'
+
+# Longest command line the device accepts (communication.LINE_MAX)
+LINE_MAX = 1024
+
+# Single-byte E-STOP/RESUME codes (estop.py), read ahead of any command line
+ESTOP = b'\x18'
+RESUME = b'\x16'
+
+
+def candidate_ports():
+    """Ports worth probing: RP2040 boards plus the usual fallback names
+
+    Probing writes a PING, and opening some devices resets them, so other
+    enumerated ports (printers, other controllers) are only tried when no
+    RP2040 board shows up at all.
+    """
+    found = list_ports.comports()
+    ports = [info.device for info in found if info.vid == RP2040_VID]
+    if not ports:
+        ports = [info.device for info in found]
+    return ports + [port for port in CANDIDATE_PORTS if port not in ports]
+
+
+def probe_port(port, baudrate=BAUDRATE, timeout=PROBE_TIMEOUT):
+    """True if the port answers a PING (or is already streaming STATUS) like a Servo2040"""
+    try:
+        ser = serial.Serial(port, baudrate, timeout=0.05)
+    except (serial.SerialException, OSError, ValueError):
+        return False
+    try:
+        # The newline flushes any half-typed line on the device first
+        ser.write(b'\r\n' + ping_command(0).encode('utf-8') + b'\n')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if ser.readline().startswith((b"PONG:", b"STATUS:")):
+                return True
+        return False
+    except (serial.SerialException, OSError):
+        return False
+    finally:
+        ser.close()
+
+
+def find_port(ports=None, baudrate=BAUDRATE, timeout=PROBE_TIMEOUT):
+    """Probe every candidate at once and return the first that answers, or None"""
+    ports = candidate_ports() if ports is None else ports
+    if not ports:
+        return None
+    pool = ThreadPoolExecutor(max_workers=len(ports))
+    try:
+        probes = {pool.submit(probe_port, port, baudrate, timeout): port for port in ports}
+        for probe in as_completed(probes):
+            if probe.result():
+                return probes[probe]
+        return None
+    finally:
+        # Slower probes finish (and close their ports) on their own
+        pool.shutdown(wait=False)
+
+
+@dataclass
+class AxisStatus:
+    name: str
+    position: float
+    measured: Optional[float]
+    min: float
+    max: float
+    home: float
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["position"], data.get("measured"),
+                   data["min"], data["max"], data["home"])
+
+
+@dataclass
+class Status:
+    mode: str
+    current: float
+    overloaded: bool
+    axes: List[AxisStatus]
+    t: Optional[int] = None                 # device ticks_ms
+    received: float = 0.0                   # host time.monotonic()
+    frame: Optional[int] = None
+    total_frames: Optional[int] = None
+    speed: Optional[float] = None           # SPEED override, PLAYBACK only
+    rate: Optional[float] = None            # rate the playback clock runs at after limits
+    predicted_current: Optional[float] = None
+    boot: Optional[dict] = None
+    estop: bool = False
+    cores: List[dict] = field(default_factory=list)  # per-core busy/period_us/jitter_us
+    gc: Optional[dict] = None                        # collections, pauses and heap levels
+    raw: dict = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data, received=0.0):
+        return cls(
+            mode=data.get("mode", "Unknown"),
+            current=data.get("current", 0.0),
+            overloaded=data.get("overloaded", False),
+            axes=[AxisStatus.from_dict(axis) for axis in data.get("axes", [])],
+            t=data.get("t"),
+            received=received,
+            frame=data.get("frame"),
+            total_frames=data.get("total_frames"),
+            speed=data.get("speed"),
+            rate=data.get("rate"),
+            predicted_current=data.get("predicted_current"),
+            boot=data.get("boot"),
+            estop=data.get("estop", False),
+            cores=data.get("cores", []),
+            gc=data.get("gc"),
+            raw=data,
+        )
+
+
+@dataclass
+class Ack:
+    cmd: str
+    ok: bool
+    t: Optional[int]
+    received: float
+
+
+@dataclass
+class EstopReport:
+    state: str                  # "stopped" or "resumed"
+    t: Optional[int]            # device ticks_ms when it acted
+    latency_us: Optional[int]   # device: byte read -> every servo disabled
+    count: int                  # E-STOPs since boot
+    round_trip: float           # host: byte written -> confirmation read, seconds
+    received: float
+
+
+class ServoClient:
+    """Serial connection to a Servo2040 running main.py"""
+
+    def __init__(self, baudrate=BAUDRATE):
+        self.baudrate = baudrate
+        self.ser = None
+        self.port = None
+        self.connected = False
+        self.rx_count = 0
+        self.tx_count = 0
+        self.clock = ClockSync()
+        self.last_status = None
+        self.sequences = None   # last SEQUENCES listing from the device
+        self.axes = None        # last AXES metadata, sent after each config reload
+        self.cmd_stats = None   # last CMD_STATS report
+
+        self.status_callbacks = []
+        self.line_callbacks = []
+        self.connection_callbacks = []
+
+        self.write_lock = threading.Lock()
+        # Guards the futures below, shared by callers and the reader thread
+        self.pending_lock = threading.Lock()
+        self.pending = deque()      # (command, sent, Future) awaiting ACK, in send order
+        self.pings = {}             # seq -> Future awaiting PONG
+        self.estops = deque()       # (state, sent, Future) awaiting an ESTOP line
+        self.ping_seq = 0
+        self.reader = None
+
+        # Transport supervisor
+        self.supervising = False
+        self.supervisor = None
+        self.search_ports = None  # None searches every candidate port
+        self.wake = threading.Event()
+        self.last_rx = 0.0
+        self.lost_at = None
+        self.last_downtime = None
+        self.connect_time = None
+
+    # Callbacks
+
+    def on_status(self, callback):
+        """callback(Status) for every STATUS line"""
+        self.status_callbacks.append(callback)
+
+    def on_line(self, callback):
+        """callback(line, received) for every line read, before it is parsed"""
+        self.line_callbacks.append(callback)
+
+    def on_connection(self, callback):
+        """callback(connected, port) whenever the link goes up or down
+
+        After a reconnect, last_downtime holds how long the link was down.
+        """
+        self.connection_callbacks.append(callback)
+
+    # Connection
+
+    def connect(self, port, timeout=1.0):
+        """Open a port and start reading; raises serial.SerialException on failure"""
+        if self.connected:
+            self.disconnect()
+        self.ser = serial.Serial(port, self.baudrate, timeout=timeout)
+        self.port = port
+        self.connected = True
+        self.clock.reset()
+        self.last_rx = time.monotonic()
+        self.last_downtime = None if self.lost_at is None else self.last_rx - self.lost_at
+        self.lost_at = None
+        self.reader = threading.Thread(target=self.read_loop, args=(self.ser,), daemon=True)
+        self.reader.start()
+        self.notify_connection()
+
+    def auto_connect(self, ports=None):
+        """Find a Servo2040 by probing all candidate ports at once; returns the port or None"""
+        started = time.monotonic()
+        port = find_port(ports, self.baudrate)
+        if port is None:
+            return None
+        try:
+            self.connect(port)
+        except (serial.SerialException, OSError):
+            return None
+        self.connect_time = time.monotonic() - started
+        return port
+
+    def start(self, ports=None):
+        """Connect in the background and keep reconnecting with backoff until disconnect()
+
+        ports limits the search (e.g. to an emulator's pty); None probes them all.
+        """
+        self.search_ports = ports
+        self.supervising = True
+        if self.supervisor is None or not self.supervisor.is_alive():
+            self.supervisor = threading.Thread(target=self.supervise, daemon=True)
+            self.supervisor.start()
+        self.wake.set()
+
+    def supervise(self):
+        started = time.monotonic()
+        backoff = BACKOFF_INITIAL
+        while self.supervising:
+            if self.connected:
+                backoff = BACKOFF_INITIAL
+                silence = time.monotonic() - self.last_rx
+                if silence > LINK_TIMEOUT:
+                    self.drop_link(TimeoutError(f"No data for {LINK_TIMEOUT}s"))
+                    continue
+                if silence > LINK_TIMEOUT / 2:
+                    # A quiet device (e.g. STATUS off) still has to answer this
+                    try:
+                        self.ping()
+                    except (ConnectionError, serial.SerialException, OSError) as e:
+                        self.drop_link(e)
+                        continue
+                # Commands the device never answers would otherwise wait forever
+                self.expire_pending(time.monotonic())
+                self.wake.wait(LINK_TIMEOUT / 4)
+                self.wake.clear()
+                continue
+
+            # The last port is probed alongside the rest, since a reset board can re-enumerate
+            ports = candidate_ports() if self.search_ports is None else list(self.search_ports)
+            if self.port in ports:
+                ports.remove(self.port)
+            if self.port:
+                ports.insert(0, self.port)
+            port = find_port(ports, self.baudrate)
+            if port is not None and self.supervising and not self.connected:
+                try:
+                    self.connect(port)
+                    if self.connect_time is None:
+                        self.connect_time = time.monotonic() - started
+                    continue
+                except (serial.SerialException, OSError):
+                    pass
+            self.wake.wait(backoff)
+            self.wake.clear()
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def drop_link(self, error):
+        """Close a link that has gone bad and let the supervisor bring it back"""
+        try:
+            self.ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        self.connection_lost(error)
+
+    def disconnect(self):
+        """Close the port on purpose; this also stops auto-reconnect"""
+        self.supervising = False
+        self.wake.set()
+        if self.ser is None:
+            return
+        self.connected = False
+        try:
+            self.ser.close()
+        finally:
+            self.fail_pending(ConnectionError("Disconnected"))
+            self.notify_connection()
+
+    def notify_connection(self):
+        for callback in self.connection_callbacks:
+            callback(self.connected, self.port)
+
+    def fail_pending(self, error):
+        with self.pending_lock:
+            futures = [future for _, _, future in self.pending]
+            futures.extend(self.pings.values())
+            futures.extend(future for _, _, future in self.estops)
+            self.pending.clear()
+            self.pings.clear()
+            self.estops.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    # Sending
+
+    def write(self, data):
+        if not self.connected:
+            raise ConnectionError("Not connected")
+        with self.write_lock:
+            self.ser.write(data)
+            self.tx_count += 1
+
+    def send(self, command):
+        """Send one command line; the future resolves to its Ack"""
+        future = Future()
+        with self.write_lock:
+            if not self.connected:
+                raise ConnectionError("Not connected")
+            with self.pending_lock:
+                self.pending.append((command, time.monotonic(), future))
+            self.ser.write((command + "\n").encode('utf-8'))
+            self.tx_count += 1
+        return future
+
+    def ping(self):
+        """Send a PING; the future resolves to the round-trip time in seconds"""
+        future = Future()
+        with self.pending_lock:
+            self.ping_seq += 1
+            seq = self.ping_seq
+            self.pings[seq] = future
+        self.write((ping_command(seq) + "\n").encode('utf-8'))
+        return future
+
+    def home_all(self):
+        return self.send("HOME_ALL")
+
+    def home_axis(self, index):
+        return self.send(f"HOME_AXIS:{index}")
+
+    def set_mode(self, mode_index):
+        return self.send(f"SET_MODE:{mode_index}")
+
+    def restart_playback(self):
+        return self.send("RESTART_PLAYBACK")
+
+    def set_speed(self, speed):
+        """Scale playback time (1.0 = as recorded); the device may still run slower to stay in limits"""
+        return self.send(f"SPEED:{speed:g}")
+
+    def list_sequences(self):
+        """The device's sequence library as of its last scan; resolves to its listing dict"""
+        return self.send_for_reply("LIST_SEQUENCES", "sequences")
+
+    def scan_sequences(self):
+        """Rescan the library for CSVs copied in since boot; resolves to the new listing"""
+        return self.send_for_reply("SCAN_SEQUENCES", "sequences")
+
+    def reload_config(self):
+        """Re-read config.json on the device; resolves to its AXES report"""
+        return self.send_for_reply("RELOAD_CONFIG", "axes")
+
+    def push_config(self, config):
+        """Send an axis table (config.json contents) to apply and save; resolves to the AXES report"""
+        command = "CONFIG_PUSH:" + json.dumps(config, separators=(",", ":"))
+        if len(command.encode('utf-8')) >= LINE_MAX:
+            raise ValueError(f"Config is {len(command)} bytes, the device takes at most {LINE_MAX - 1}")
+        return self.send_for_reply(command, "axes")
+
+    def command_stats(self):
+        """Per-command count and min/max/mean handling time on the device"""
+        return self.send_for_reply("CMD_STATS", "cmd_stats")
+
+    def send_for_reply(self, command, attribute):
+        """Send a command whose reply line lands in self.<attribute> ahead of its ACK"""
+        future = Future()
+
+        def done(ack_future):
+            error = ack_future.exception()
+            if error is not None:
+                future.set_exception(error)
+            elif not ack_future.result().ok:
+                future.set_exception(RuntimeError(f"{command.split(':')[0]} refused by the device"))
+            else:
+                future.set_result(getattr(self, attribute))
+        # Cleared so a failed command can't resolve to an older reply
+        setattr(self, attribute, None)
+        self.send(command).add_done_callback(done)
+        return future
+
+    def select_sequence(self, name):
+        """Make a stored sequence the playback program; the Ack is not ok if unknown or corrupt"""
+        return self.send(f"SELECT_SEQUENCE:{name}")
+
+    def log_dump(self):
+        return self.send("LOG_DUMP")
+
+    def set_log_level(self, level):
+        return self.send(f"LOG_LEVEL:{level}")
+
+    def estop(self):
+        """Stop every servo without stopping main.py; resolves to an EstopReport"""
+        return self.send_control(ESTOP, "stopped")
+
+    def resume(self):
+        """Release the E-STOP latch; resolves to an EstopReport"""
+        return self.send_control(RESUME, "resumed")
+
+    def send_control(self, code, state):
+        future = Future()
+        entry = (state, time.monotonic(), future)
+        # Queued before writing: the confirmation can beat write() back
+        with self.pending_lock:
+            self.estops.append(entry)
+        try:
+            self.write(code)
+        except Exception as e:
+            with self.pending_lock:
+                if entry in self.estops:
+                    self.estops.remove(entry)
+            future.set_exception(e)
+        return future
+
+    def interrupt(self):
+        """Ctrl+C: stops main.py and drops to the REPL"""
+        self.write(CTRL_C)
+
+    def soft_reset(self):
+        """Ctrl+D: soft-resets the board"""
+        self.write(CTRL_D)
+
+    # Receiving
+
+    def read_loop(self, ser):
+        # Whatever is waiting is read in one call; readline() fetches a byte at a
+        # time and can't keep up with STATUS much above 200 Hz
+        pending = b""
+        while self.connected and ser is self.ser:
+            try:
+                chunk = ser.read(ser.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                # A deliberate disconnect closes the port under us; that isn't a loss
+                if self.connected and ser is self.ser:
+                    self.connection_lost(e)
+                return
+            if not chunk:
+                continue
+            received = time.monotonic()
+            pending += chunk
+            if b"\n" not in chunk:
+                continue
+            *lines, pending = pending.split(b"\n")
+            for raw in lines:
+                self.handle_line(raw.decode('utf-8', errors='ignore').strip(), received)
+
+    def connection_lost(self, error):
+        if not self.connected:
+            return
+        self.connected = False
+        self.lost_at = time.monotonic()
+        self.fail_pending(ConnectionError(f"Connection lost: {error}"))
+        self.notify_connection()
+        self.wake.set()
+
+    def resync(self):
+        """The board restarted under an open port: its ticks and command queue are gone"""
+        self.clock.reset()
+        self.fail_pending(ConnectionError("Device restarted"))
+
+    def handle_line(self, line, received):
+        if not line:
+            return
+        self.rx_count += 1
+        self.last_rx = received
+        for callback in self.line_callbacks:
+            callback(line, received)
+
+        if line.startswith("STATUS:"):
+            try:
+                status = Status.from_dict(json.loads(line[7:]), received)
+            except (ValueError, KeyError, TypeError):
+                return
+            if status.boot is not None:
+                # Only the first STATUS after boot carries this
+                self.resync()
+            if status.t is not None:
+                self.clock.observe(status.t, received)
+            self.last_status = status
+            for callback in self.status_callbacks:
+                callback(status)
+        elif line.startswith("ACK:"):
+            try:
+                data = json.loads(line[4:])
+            except ValueError:
+                return
+            ack = Ack(data.get("cmd", ""), data.get("ok", False), data.get("t"), received)
+            if ack.t is not None:
+                self.clock.observe(ack.t, received)
+            self.resolve_ack(ack, received)
+        elif line.startswith("CMD_STATS:"):
+            try:
+                self.cmd_stats = json.loads(line[10:])
+            except ValueError:
+                return
+        elif line.startswith("AXES:"):
+            try:
+                self.axes = json.loads(line[5:])
+            except ValueError:
+                return
+        elif line.startswith("SEQUENCES:"):
+            try:
+                self.sequences = json.loads(line[10:])
+            except ValueError:
+                return
+        elif line.startswith("ESTOP:"):
+            try:
+                data = json.loads(line[6:])
+            except ValueError:
+                return
+            if data.get("t") is not None:
+                self.clock.observe(data["t"], received)
+            self.resolve_estop(data, received)
+        elif line.startswith("PONG:"):
+            try:
+                seq, host_sent, device_rx, device_tx = parse_pong(line)
+            except ValueError:
+                return
+            rtt = self.clock.add_ping(host_sent, device_rx, device_tx, received)
+            with self.pending_lock:
+                future = self.pings.pop(seq, None)
+            if future is not None and not future.done():
+                future.set_result(rtt)
+
+    def resolve_estop(self, data, received):
+        state = data.get("state")
+        with self.pending_lock:
+            for entry in self.estops:
+                if entry[0] == state:
+                    self.estops.remove(entry)
+                    break
+            else:
+                return
+        _, sent, future = entry
+        if not future.done():
+            future.set_result(EstopReport(state, data.get("t"), data.get("latency_us"),
+                                          data.get("count", 0), received - sent, received))
+
+    def resolve_ack(self, ack, received):
+        # ACKs can overtake each other (in dual-core mode a queue-full refusal
+        # comes straight back from core 1), so match on the command rather
+        # than failing everything queued ahead of it
+        matched = None
+        with self.pending_lock:
+            for entry in self.pending:
+                if entry[0].strip() == ack.cmd:
+                    matched = entry
+                    self.pending.remove(entry)
+                    break
+        if matched is not None and not matched[2].done():
+            matched[2].set_result(ack)
+        self.expire_pending(received)
+
+    def expire_pending(self, now):
+        """Fail commands that have waited ACK_TIMEOUT, e.g. a malformed PING that gets no ACK"""
+        expired = []
+        with self.pending_lock:
+            # Send order, so the stale ones are at the front
+            while self.pending and now - self.pending[0][1] > ACK_TIMEOUT:
+                expired.append(self.pending.popleft())
+        for command, _, future in expired:
+            if not future.done():
+                future.set_exception(TimeoutError(f"No ACK for {command}"))
@@ -0,0 +1,104 @@
+"""Teach mode: record jogged positions from STATUS and reduce them to keyframes."""
+import numpy as np
+
+DEFAULT_TOLERANCE = 0.5  # degrees, worst allowed deviation on any axis
+
+
+class TeachRecorder:
+    """Collects timestamped axis positions while the arm is being jogged"""
+
+    def __init__(self):
+        self.times = []
+        self.frames = []
+        self.recording = False
+
+    def start(self):
+        self.times = []
+        self.frames = []
+        self.recording = True
+
+    def stop(self):
+        self.recording = False
+
+    def add(self, t, positions):
+        """Append one sample (seconds, one value per axis) if recording"""
+        if not self.recording:
+            return
+        # Repeated STATUS for the same device time adds nothing
+        if self.times and t <= self.times[-1]:
+            return
+        self.times.append(t)
+        self.frames.append(list(positions))
+
+    def __len__(self):
+        return len(self.times)
+
+    def trajectory(self):
+        """Recorded samples as (times[N], positions[N, axes]) arrays"""
+        return np.asarray(self.times, dtype=float), np.asarray(self.frames, dtype=float)
+
+
+def reduce_keyframes(times, positions, tolerance=DEFAULT_TOLERANCE):
+    """Indices of the fewest samples whose linear replay stays within tolerance
+
+    Ramer-Douglas-Peucker over the time-parameterised trajectory: each
+    interior sample is compared with the straight-line interpolation between
+    the segment's end keyframes at the same time, on every axis at once.
+    """
+    times = np.asarray(times, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    count = len(times)
+    if count <= 2:
+        return np.arange(count)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        span = times[last] - times[first]
+        inner = slice(first + 1, last)
+        if span > 0:
+            fraction = (times[inner] - times[first]) / span
+        else:
+            fraction = np.zeros(last - first - 1)
+        expected = positions[first] + fraction[:, None] * (positions[last] - positions[first])
+        error = np.abs(positions[inner] - expected).max(axis=1)
+        worst = int(error.argmax())
+        if error[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def max_replay_error(times, positions, keyframes):
+    """Worst per-axis deviation when the keyframes are replayed with linear interpolation"""
+    times = np.asarray(times, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    replay = np.column_stack([
+        np.interp(times, times[keyframes], positions[keyframes, axis])
+        for axis in range(positions.shape[1])
+    ])
+    return float(np.abs(replay - positions).max()) if len(times) else 0.0
+
+
+def save_sequence(filename, positions, times=None):
+    """Write frames in the CSV layout ConfigManager.load_sequence reads
+
+    With times (seconds), each row starts with its timestamp in ms from the
+    first frame so playback keeps the recorded timing between keyframes.
+    """
+    positions = np.asarray(positions, dtype=float)
+    if times is not None:
+        times = np.asarray(times, dtype=float)
+        stamps = np.rint((times - times[0]) * 1000).astype(int)
+    with open(filename, "w") as f:
+        for index, frame in enumerate(positions):
+            row = ",".join(f"{value:.2f}" for value in frame)
+            if times is not None:
+                row = f"{stamps[index]}," + row
+            f.write(row + "\n")
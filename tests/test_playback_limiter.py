@@ -0,0 +1,30 @@
+from array import array
+from types import SimpleNamespace
+
+from playback_limiter import PlaybackLimiter, SPEED_MIN, SPEED_MAX
+from sequence import Sequence
+
+
+def make_limiter(budget, idle):
+    axes = [{"max_speed": 240.0, "max_accel": 1200.0} for _ in range(2)]
+    scheduler = SimpleNamespace(current_budget=budget, idle_current=idle, gains=[0.004, 0.004])
+    hardware = SimpleNamespace(axes=axes, scheduler=scheduler)
+    return PlaybackLimiter(hardware, lambda *args: None)
+
+
+def make_sequence(frames):
+    times = array('l', [i * 100 for i in range(len(frames))])
+    return Sequence(lambda: (frames, times), frame_rate=10)
+
+
+def test_hold_frames_under_negative_headroom():
+    # Idle draw over budget, and only hold segments ahead: no current cap to apply
+    limiter = make_limiter(budget=1.0, idle=1.5)
+    sequence = make_sequence([[0.0, 0.0]] * 6)
+    assert limiter.look_ahead(sequence, 0) == SPEED_MAX
+
+
+def test_moving_frames_under_negative_headroom_run_at_the_floor():
+    limiter = make_limiter(budget=1.0, idle=1.5)
+    sequence = make_sequence([[0.0, 0.0], [0.0, 0.0], [10.0, 0.0], [20.0, 0.0]])
+    assert limiter.look_ahead(sequence, 0, loop=False) == SPEED_MIN
@@ -1,23 +1,24 @@
 import time
+import gc
 from servo import servo2040
+from logger import Logger
+
+# Shared logger for the whole firmware
+log = Logger()
+
+# Kept under its old name: every component takes it as its debug_log hook.
+# Pass a format string and arguments so disabled levels never build the text.
+debug_log = log.debug
 
-def debug_log(message):
-    """Centralized debug logging - works in both REPL and UART"""
-    # First try to print to REPL (visible in your development environment)
-    try:
-        print(f"DEBUG: {message}")
-    except:
-        pass
-    
-    # Also send to UART if available
-    #if uart:
-    #    try:
-    #        uart.write(f"DEBUG uart: {message}\n")
-    #    except:
-    #        pass
-        
 def read_current(hardware):
     """Read current with averaging for stability"""
+    if hardware.adc_lock:
+        # Core 1 is scanning the same mux
+        with hardware.adc_lock:
+            return average_current(hardware)
+    return average_current(hardware)
+
+def average_current(hardware):
     samples = 5
     total = 0
     hardware.mux.select(servo2040.CURRENT_SENSE_ADDR)
@@ -27,9 +28,14 @@ def read_current(hardware):
         time.sleep(0.001)
     return total / samples
 
-def handle_overload(hardware, current_reading, max_current, debug_log):
-    """Handle overcurrent situation"""
-    debug_log(f"OVERLOAD DETECTED! {current_reading:.2f}A > {max_current}A")
+def handle_overload(hardware, current_reading, max_current, debug_log, wait=None):
+    """Handle overcurrent situation
+
+    wait(ms) replaces the sleep between readings so an E-STOP is still
+    read during the spin; it must not run commands (Communication.wait_control).
+    Pass None when another core reads input.
+    """
+    log.warn("OVERLOAD DETECTED! %.2fA > %sA", current_reading, max_current)
     overloaded = True
     
     # Disable all servos
@@ -40,12 +46,161 @@ def handle_overload(hardware, current_reading, max_current, debug_log):
     debug_log("Waiting for current to normalize...")
     while True:
         current = read_current(hardware)
-        debug_log(f"Current reading: {current:.2f}A")
+        debug_log("Current reading: %.2fA", current)
         if current <= max_current * 0.8:
             break
-        time.sleep(0.1)
+        if wait:
+            wait(100)
+        else:
+            time.sleep(0.1)
+        if hardware.estop and hardware.estop.latched:
+            debug_log("E-STOP during overload, servos stay off")
+            return False
+    
+    if hardware.estop and hardware.estop.latched:
+        return False
     
     # Re-enable servos
     debug_log("Re-enabling servos")
     hardware.enable_servos()
-    return False  # Overload cleared
\ No newline at end of file
+    return False  # Overload cleared
+
+class StartupProfile:
+    """Timestamps each init phase from power-on to the first STATUS"""
+
+    def __init__(self, start_us=None):
+        self.start = time.ticks_us() if start_us is None else start_us
+        self.last = self.start
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.ticks_us()
+        self.phases.append((phase, time.ticks_diff(now, self.last)))
+        self.last = now
+
+    def report(self):
+        """Phase durations and total in ms, suitable for the STATUS JSON"""
+        report = {}
+        for phase, us in self.phases:
+            report[phase] = us / 1000
+        report["total"] = time.ticks_diff(self.last, self.start) / 1000
+        return report
+
+class LoopStats:
+    """Busy share and period jitter of one loop, reset each time it is reported"""
+
+    def __init__(self):
+        self.start = time.ticks_us()
+        # Reused by every report so STATUS doesn't allocate a dict per core
+        self.summary = {"busy": 0, "period_us": 0, "jitter_us": 0, "busy_max_us": 0}
+        self.reset(self.start)
+
+    def reset(self, now):
+        self.window_start = now
+        self.busy_us = 0
+        self.busy_max = 0
+        self.loops = 0
+        self.min_period = 0x3FFFFFFF
+        self.max_period = 0
+
+    def begin(self):
+        """Call at the top of each loop pass"""
+        now = time.ticks_us()
+        period = time.ticks_diff(now, self.start)
+        if period < self.min_period:
+            self.min_period = period
+        if period > self.max_period:
+            self.max_period = period
+        self.start = now
+        self.loops += 1
+
+    def end(self, idle_us=0):
+        """Call when the pass' work is done; returns its busy time in us
+
+        idle_us is time inside the pass spent waiting rather than working,
+        e.g. blocked in Communication.wait() while it also ran commands.
+        """
+        busy = time.ticks_diff(time.ticks_us(), self.start) - idle_us
+        self.busy_us += busy
+        if busy > self.busy_max:
+            self.busy_max = busy
+        return busy
+
+    def report(self):
+        """Busy percent, mean period, peak-to-peak jitter and worst pass (us) for the STATUS JSON"""
+        now = time.ticks_us()
+        window = time.ticks_diff(now, self.window_start)
+        summary = self.summary
+        if self.loops and window > 0:
+            summary["busy"] = round(100 * self.busy_us / window, 1)
+            summary["period_us"] = window // self.loops
+            summary["jitter_us"] = self.max_period - self.min_period
+            summary["busy_max_us"] = self.busy_max
+        self.reset(now)
+        return summary
+
+
+# Collect once this fraction of the heap left free by the last collection has been used up
+GC_HEADROOM_FRACTION = 4
+# Automatic collection backstop, as a fraction of the free heap (e.g. sequence loads)
+GC_THRESHOLD_FRACTION = 2
+
+class GcMonitor:
+    """Collects at a quiet point of the loop once the heap runs low, and times each pause
+
+    gc.threshold only fires if something allocates far more than a loop's
+    worth between two checks; otherwise the pause always lands where
+    update() is called instead of inside a motion step.
+    """
+
+    def __init__(self):
+        gc.collect()
+        free = gc.mem_free()
+        self.low_water = free - free // GC_HEADROOM_FRACTION
+        gc.threshold(free // GC_THRESHOLD_FRACTION)
+        self.collections = 0
+        self.window_collections = 0
+        self.pause_last = 0
+        self.pause_max = 0
+        self.free_after = free
+        self.free_min = free
+        self.summary = {"collections": 0, "window_collections": 0, "pause_us": 0, "pause_max_us": 0,
+                        "free": free, "free_min": free, "free_after": free}
+
+    def update(self):
+        """Collect if the heap is below the low-water mark; returns the pause in us"""
+        free = gc.mem_free()
+        if free < self.free_min:
+            self.free_min = free
+        if free >= self.low_water:
+            return 0
+        start = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start)
+        self.collections += 1
+        self.window_collections += 1
+        self.pause_last = pause
+        if pause > self.pause_max:
+            self.pause_max = pause
+        # Live heap after a collection: a falling trend here is a leak
+        free_after = gc.mem_free()
+        self.free_after = free_after
+        # Re-based on what is live now, so a sequence or cache loaded after
+        # boot doesn't leave the heap below the mark and collect every pass
+        self.low_water = free_after - free_after // GC_HEADROOM_FRACTION
+        return pause
+
+    def report(self):
+        """Collections so far, pause figures and heap levels since the last report"""
+        summary = self.summary
+        summary["collections"] = self.collections
+        summary["window_collections"] = self.window_collections
+        summary["pause_us"] = self.pause_last
+        summary["pause_max_us"] = self.pause_max
+        summary["free"] = gc.mem_free()
+        summary["free_min"] = self.free_min
+        summary["free_after"] = self.free_after
+        self.pause_max = 0
+        self.window_collections = 0
+        self.free_min = summary["free"]
+        return summary
\ No newline at end of file